@@ -1,2 +1,209 @@
-from src.EDA_County_Stats_with_temp import *
-from src.Simple_Linear_regression import *
+import argparse
+import os
+import sys
+
+# Command line entry point: python __main__.py [build|eda|regress|search|sweep|score]
+# Without a subcommand it runs the EDA followed by the regressions, as before.
+# The analysis modules are imported only by the subcommand that needs them.
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, REPO_DIR)
+
+
+def build(args):
+    # The build script and its helpers import each other as siblings
+    sys.path.insert(0, os.path.join(REPO_DIR, "data", "scripts"))
+    from cleanup_with_temperature import main
+
+    main(workers=args.workers, force=args.force, only=args.only, excel=args.excel, anomalies=args.anomalies)
+
+
+# --plots DIR renders every figure to DIR headlessly instead of showing it
+def configure_plots(args):
+    from src.plotting import configure
+
+    configure(output_dir=args.plots, workers=args.plot_workers, dpi=args.dpi, pairplot=args.pairplot,
+              max_pairplot_features=args.max_pairplot_features, max_pairplot_rows=args.max_pairplot_rows)
+
+
+def eda(args):
+    from src.EDA_County_Stats_with_temp import run_eda
+
+    configure_plots(args)
+    x_thresh = args.threshold
+    if args.best_by is not None:
+        from src.EDA_County_Stats_with_temp import load_county_stats
+        from src.threshold_sweep import choose_threshold, run_sweep
+
+        x_thresh, _, _ = choose_threshold(run_sweep(load_county_stats(), n_boot=0), by=args.best_by)
+        print(f"Threshold with the best {args.best_by}: {x_thresh} F")
+    written = run_eda(x_thresh=x_thresh)
+    if written:
+        print(f"Wrote {len(written)} figures to {args.plots}")
+
+
+def regress(args):
+    from src.Simple_Linear_regression import run_regressions
+
+    configure_plots(args)
+    written = run_regressions()
+    if written:
+        print(f"Wrote {len(written)} figures to {args.plots}")
+
+
+def sweep(args):
+    import pandas as pd
+
+    from src.EDA_County_Stats_with_temp import load_county_stats
+    from src.threshold_sweep import THRESHOLDS, choose_threshold, run_sweep
+
+    thresholds = THRESHOLDS if args.thresholds is None else args.thresholds
+    surface = run_sweep(load_county_stats(), thresholds, n_boot=args.boot, level=args.level, seed=args.seed,
+                        workers=args.workers, out=args.out)
+    with pd.option_context("display.max_rows", None, "display.width", 200):
+        print(surface.round(4).to_string(index=False))
+    x_thresh, m, b = choose_threshold(surface, args.threshold)
+    print(f"At {x_thresh} F: m = {m} b = {b}")
+
+
+def search(args):
+    import pandas as pd
+
+    from src.feature_search import run_search
+
+    table = run_search(args.max_size, args.splits, args.repeats, args.seed, args.rank_by, args.out, args.cvi)
+    with pd.option_context("display.max_colwidth", None, "display.width", 250):
+        print(table.head(args.top).round(4).to_string())
+
+
+# FEATURE=v1,v2,... -> (feature, [v1, v2, ...]), the feature name may contain "=" only before the last one
+def feature_values(text):
+    feature, sep, values = text.rpartition("=")
+    if not sep or not feature:
+        raise argparse.ArgumentTypeError(f"expected FEATURE=v1,v2,... not {text!r}")
+    try:
+        return feature, [float(v) for v in values.split(",")]
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"values of {feature!r} must be numbers: {values!r}")
+
+
+def score(args):
+    import pandas as pd
+
+    from src.scenario_scoring import run_scoring
+
+    model, table = run_scoring(args.temp, dict(args.scale or []), dict(args.delta or []), args.threshold, args.clip,
+                               args.out)
+    print(f"Heat curve: m = {model.m:.4g} b = {model.b:.4g} above {model.x_thresh} F")
+    print("Residual regression: " + " ".join(f"{c:+.4g} * {f}" for f, c in zip(model.features, model.coef))
+          + f" {model.intercept:+.4g}")
+    with pd.option_context("display.max_rows", args.top, "display.width", 250):
+        print(table.head(args.top).round(3).to_string(index=False))
+    if args.out:
+        print(f"Wrote the scenario x county scores to {args.out}")
+
+
+# The plot flags are accepted before and after the subcommand (--plots D eda or eda --plots D)
+# The subcommand copies default to SUPPRESS, so they only override values given after the subcommand
+def add_plot_arguments(parser, subcommand=False):
+    def default(value):
+        return argparse.SUPPRESS if subcommand else value
+
+    parser.add_argument("--plots", metavar="DIR", default=default(None),
+                        help="save figures as PNG files in DIR instead of showing them")
+    parser.add_argument("--plot-workers", type=int, default=default(1),
+                        help="processes rendering the figures with --plots (default: 1)")
+    parser.add_argument("--dpi", type=int, default=default(100), help="resolution of the saved figures")
+    parser.add_argument("--pairplot", choices=("full", "skip"), default=default("full"),
+                        help="draw or skip the pair plot grids")
+    parser.add_argument("--max-pairplot-features", type=int, default=default(None), metavar="N",
+                        help="only the first N features in pair plots")
+    parser.add_argument("--max-pairplot-rows", type=int, default=default(None), metavar="N",
+                        help="randomly sample N rows for pair plots")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="__main__.py", description="Beating the Heat analysis pipeline")
+    commands = parser.add_subparsers(dest="command")
+
+    build_parser = commands.add_parser("build", help="rebuild the county and CVI tables from data/")
+    build_parser.add_argument("--workers", type=int, default=None,
+                              help="worker processes/threads for reading sources (default: CPU count)")
+    build_parser.add_argument("--force", action="store_true", help="rebuild every stage")
+    build_parser.add_argument("--stage", action="append", dest="only", metavar="NAME",
+                              help="only consider this stage (repeatable): temperature, panel, climatology, "
+                                   "county_stats, cvi, cvi_counties")
+    build_parser.add_argument("--excel", action="store_true", help="also write the Excel report copies")
+    build_parser.add_argument("--anomalies", action="store_true",
+                              help="add the heat anomaly features (degrees above normal / p90) to county_stats")
+    build_parser.set_defaults(func=build)
+
+    add_plot_arguments(parser)
+    parser.set_defaults(threshold=80.0, best_by=None)
+    parser.add_argument("--no-cache", action="store_true",
+                        help="recompute the fits and CV scores instead of reusing .result_cache/")
+    parser.add_argument("--clear-cache", action="store_true", help="empty .result_cache/ first")
+    eda_parser = commands.add_parser("eda", help="temperature fits, residuals and pair plots")
+    add_plot_arguments(eda_parser, subcommand=True)
+    eda_parser.add_argument("--threshold", type=float, default=80.0,
+                            help="heat breakpoint in F for the temperature fit and residuals (default: 80)")
+    eda_parser.add_argument("--best-by", choices=("r2",), default=None,
+                            help="use the threshold of the sweep with the highest r2")
+    eda_parser.set_defaults(func=eda)
+    regress_parser = commands.add_parser("regress", help="per-feature KFold regressions")
+    add_plot_arguments(regress_parser, subcommand=True)
+    regress_parser.set_defaults(func=regress)
+
+    search_parser = commands.add_parser("search", help="cross-validate every subset of the indicators")
+    search_parser.add_argument("--max-size", type=int, default=2, help="largest feature subset (default: 2)")
+    search_parser.add_argument("--splits", type=int, default=5, help="folds per repeat")
+    search_parser.add_argument("--repeats", type=int, default=10, help="shuffled KFold repeats")
+    search_parser.add_argument("--seed", type=int, default=25)
+    search_parser.add_argument("--rank-by", choices=("rmse", "r2"), default="rmse")
+    search_parser.add_argument("--cvi", action="store_true",
+                               help="also search the county aggregates of the tract level CVI and food access")
+    search_parser.add_argument("--top", type=int, default=20, help="rows to print")
+    search_parser.add_argument("--out", metavar="FILE", default=None, help="also write the full table as csv")
+    search_parser.set_defaults(func=search)
+
+    sweep_parser = commands.add_parser("sweep", help="refit the heat breakpoint over thresholds with bootstrap CIs")
+    sweep_parser.add_argument("--thresholds", type=float, nargs="+", default=None,
+                              help="thresholds in F (default: 70 to 90 in steps of 0.5)")
+    sweep_parser.add_argument("--boot", type=int, default=1000, help="bootstrap resamples of the counties")
+    sweep_parser.add_argument("--level", type=float, default=0.95, help="confidence level of the intervals")
+    sweep_parser.add_argument("--seed", type=int, default=0)
+    sweep_parser.add_argument("--workers", type=int, default=1, help="worker processes for the resamples")
+    sweep_parser.add_argument("--threshold", type=float, default=80.0, help="threshold whose fit is reported")
+    sweep_parser.add_argument("--out", metavar="FILE", default=None, help="also write the surface as csv")
+    sweep_parser.set_defaults(func=sweep)
+
+    score_parser = commands.add_parser("score", help="predict emergency visit rates for a grid of what-if scenarios")
+    score_parser.add_argument("--temp", type=float, nargs="+", default=[0.0], metavar="F",
+                              help="temperature changes in F (default: 0)")
+    score_parser.add_argument("--scale", type=feature_values, action="append", metavar="FEATURE=v1,v2",
+                              help="multiply a feature, e.g. 'Park within 1/2 Mile=1,1.1,1.2' (repeatable)")
+    score_parser.add_argument("--delta", type=feature_values, action="append", metavar="FEATURE=v1,v2",
+                              help="add to a feature, e.g. 'Imperviousness=-5,0' (repeatable)")
+    score_parser.add_argument("--threshold", type=float, default=80.0, help="heat breakpoint in F (default: 80)")
+    score_parser.add_argument("--clip", action="store_true", help="keep the changed features within 0-100%%")
+    score_parser.add_argument("--top", type=int, default=50, help="scenarios to print")
+    score_parser.add_argument("--out", metavar="FILE", default=None,
+                              help="write the full scenarios x counties scores as a .npy file")
+    score_parser.set_defaults(func=score)
+
+    args = parser.parse_args(argv)
+    if args.no_cache or args.clear_cache:
+        from src import result_cache
+
+        if args.clear_cache:
+            result_cache.clear()
+        result_cache.configure(enabled=not args.no_cache)
+    if args.command is None:
+        eda(args)
+        regress(args)
+    else:
+        args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO)
+
+from src import result_cache  # noqa: E402
+from src.EDA_County_Stats_with_temp import (  # noqa: E402
+    anchored_line, anchored_slopes, august_col, emergency_frame, fit_linear_with_intercept_enforced,
+    july_col, load_county_stats, y_col,
+)
+
+
+# Compares the iterative least_squares fit of the threshold-anchored heat model with the closed form,
+# for the three EDA fits and for stacks of candidate series (months x thresholds x county subsets)
+# fitted one by one with least_squares versus in one anchored_slopes call.
+# Usage: python benchmarks/bench_anchored_fit.py [--sizes 3 30 300 3000] [--repeat N]
+
+LOWER, UPPER = [0], [1e6]
+
+
+def candidates(series: np.ndarray, k: int, rng) -> tuple:
+    # months cycle, thresholds between 70 and 90 F, a random half of the counties left out for most rows
+    x = series[np.arange(k) % len(series)].copy()
+    thresholds = np.linspace(70, 90, k) if k > len(series) else np.full(k, 80.0)
+    if k > len(series):
+        x[rng.random(x.shape) < 0.5] = np.nan
+    return x, thresholds
+
+
+def iterative(x, y, thresholds, y_min):
+    return [fit_linear_with_intercept_enforced(row, y, LOWER, UPPER, "", x_thresh=t, y_min=y_min,
+                                               plot=False, model=anchored_line)["m"]
+            for row, t in zip(x, thresholds) if np.any(row >= t)]
+
+
+def closed_form(x, y, thresholds, y_min):
+    return anchored_slopes(x, y, thresholds, y_min, LOWER[0], UPPER[0])["m"]
+
+
+# Points whose ordinary slope is negative while the anchored slope is positive: the least_squares
+# start must not sit on the lower bound, where it stops without moving
+def check_negative_polyfit_slope():
+    x = np.array([80.0, 82.0, 84.0, 86.0, 88.0])
+    y = np.array([95.0, 90.0, 70.0, 60.0, 50.0])
+    y_min = 10.0
+    assert np.polyfit(x, y, 1)[0] < 0
+    dx, dy = x - 80.0, y - y_min
+    expected = np.sum(dx * dy) / np.sum(dx * dx)
+    fitted = iterative(x[None], y, [80.0], y_min)[0]
+    np.testing.assert_allclose(fitted, expected, rtol=1e-6)
+    np.testing.assert_allclose(closed_form(x[None], y, [80.0], y_min)[0], expected, rtol=1e-12)
+
+
+def best_time(fn, args, repeat: int) -> float:
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(*args)
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[3, 30, 300, 3000])
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+    # the fits go through src/result_cache.py, repeats would time cache hits
+    result_cache.configure(enabled=False)
+
+    df = emergency_frame(load_county_stats())
+    july = df[july_col].to_numpy(float)
+    august = df[august_col].to_numpy(float)
+    series = np.vstack([july, august, np.fmax(july, august)])
+    y = df[y_col].to_numpy(float)
+    y_min = np.nanmin(y)
+    rng = np.random.default_rng(0)
+
+    # Same slopes either way
+    x, thresholds = candidates(series, 300, rng)
+    fitted = closed_form(x, y, thresholds, y_min)
+    np.testing.assert_allclose(iterative(x, y, thresholds, y_min), fitted[~np.isnan(fitted)], rtol=1e-6)
+    check_negative_polyfit_slope()
+
+    print(f"{'fits':>6} {'least_squares ms':>17} {'closed form ms':>15} {'speedup':>8}")
+    for k in args.sizes:
+        x, thresholds = candidates(series, k, rng)
+        t_iter = best_time(iterative, (x, y, thresholds, y_min), args.repeat)
+        t_closed = best_time(closed_form, (x, y, thresholds, y_min), args.repeat)
+        print(f"{k:>6} {t_iter * 1000:>17.1f} {t_closed * 1000:>15.3f} {t_iter / t_closed:>7.0f}x")
+
+
+if __name__ == "__main__":
+    main()
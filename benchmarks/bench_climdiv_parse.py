@@ -0,0 +1,81 @@
+import argparse
+import os
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(REPO, "data", "scripts"))
+
+from climdiv import MONTHS, parse_climdiv  # noqa: E402
+
+
+# Compares the byte-buffer climdiv parser with the original pandas path
+# (whitespace read_csv + three .str slices of the ID column) on time, peak traced memory
+# and the size of the parsed result. tracemalloc does not see every buffer pandas allocates
+# in C, so the result size is the fairer memory comparison.
+# Usage: python benchmarks/bench_climdiv_parse.py [climdiv file] [--repeat N]
+
+DEFAULT_FILE = os.path.join(REPO, "data", "climdiv-norm-tmaxcy-v1.0.0-20250905.txt")
+
+
+# The parse the build script did before the dedicated parser
+def pandas_parse(file: str) -> pd.DataFrame:
+    df = pd.read_csv(file, sep=r"\s+", names=["County Data", *MONTHS], dtype={"County Data": str})
+    df["State Code"] = df["County Data"].str[:2]
+    df["FIPS"] = df["County Data"].str[2:5]
+    df["Year"] = df["County Data"].str[-4:]
+    return df
+
+
+def result_bytes(result) -> int:
+    if isinstance(result, pd.DataFrame):
+        return int(result.memory_usage(deep=True).sum())
+    return sum(arr.nbytes for arr in result.values() if isinstance(arr, np.ndarray))
+
+
+def measure(fn, file: str, repeat: int) -> dict:
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(file)
+        times.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    result = fn(file)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {"best_s": min(times), "median_s": float(np.median(times)), "peak_mib": peak / 2 ** 20,
+            "result_mib": result_bytes(result) / 2 ** 20}
+
+
+# Both parsers must agree before their timings mean anything
+def check_same(file: str):
+    ref = pandas_parse(file)
+    new = parse_climdiv(file)
+    assert (ref["State Code"].astype(int).to_numpy() == new["state"]).all()
+    assert (ref["FIPS"].astype(int).to_numpy() == new["fips"]).all()
+    assert (ref["Year"].astype(int).to_numpy() == new["year"]).all()
+    np.testing.assert_allclose(ref[MONTHS].to_numpy(dtype=np.float32), new["values"], equal_nan=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time the byte-buffer climdiv parser against the pandas parse")
+    parser.add_argument("file", nargs="?", default=DEFAULT_FILE)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    check_same(args.file)
+    print(f"{os.path.basename(args.file)}: {len(parse_climdiv(args.file)['year'])} rows")
+    for name, fn in [("pandas read_csv + .str", pandas_parse), ("parse_climdiv", parse_climdiv)]:
+        r = measure(fn, args.file, args.repeat)
+        print(f"{name:24s} best {r['best_s'] * 1000:8.1f} ms  median {r['median_s'] * 1000:8.1f} ms"
+              f"  peak {r['peak_mib']:6.1f} MiB  result {r['result_mib']:6.1f} MiB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DATA = os.path.join(REPO, "data")
+sys.path.insert(0, os.path.join(DATA, "scripts"))
+
+from county_join import PERCENT, RATE, Indicator, build_county_table  # noqa: E402
+
+
+# Compares the chained merge_csv / merge_xlsx / merge_temp_month build of county_stats
+# with build_county_table as the number of indicators grows.
+# Larger indicator counts reuse the nine Tracking Network files under new column names.
+# Usage: python benchmarks/bench_county_join.py [--counts 4 9 18 36 72] [--repeat N]
+
+CSV_FILES = [
+    "Avg_annual_energy_burden_percent_of_income_2018.csv",
+    "Avg_percent_of_imperviousness_2021.csv",
+    "Distance_to_parks_half-mile_2010_2015_2020.csv",
+    "Hospital_beds_per_10000_population_2020.csv",
+    "Housing_built_before_1980.csv",
+    "Housing_insecurity_2022.csv",
+    "Lack_of_reliable_transportation_2022.csv",
+    "Percent_without_internet_2018-2022.csv",
+    "Utility_services_threat_2022.csv",
+]
+ED_FILE = os.path.join(DATA, "Emergency Department_Visits_Age-adjusted_rate_per_100000_2023_Counties.xlsx")
+TEMP_FILE = os.path.join(DATA, "maxTempSu2023CACounty.csv")
+
+
+# The chained merges the build script used before build_county_table
+def cleanup_csv(file: str) -> pd.DataFrame:
+    df = pd.read_csv(file)
+    df = df.rename(columns={"End Year": "Year"})
+    df = df[df["Year"] == df["Year"].max()]
+    return df[["County", "Value"]]
+
+
+def merge_csv(df: pd.DataFrame, file: str, name: str):
+    df = pd.merge(df, cleanup_csv(file), how="inner", on=["County"], suffixes=(None, None))
+    return df.rename(columns={"Value": name})
+
+
+def merge_temp_month(left_df, csv_path, month, left_on="County", right_on="County"):
+    right = pd.read_csv(csv_path, usecols=[right_on, month])
+    right[right_on] = right[right_on].astype(str)
+    left = left_df.copy()
+    left[left_on] = left[left_on].astype(str)
+    return left.merge(right, how="left", left_on=left_on, right_on=right_on)
+
+
+def chained(base: pd.DataFrame, n: int) -> pd.DataFrame:
+    df = base
+    for i in range(n):
+        df = merge_csv(df, os.path.join(DATA, CSV_FILES[i % len(CSV_FILES)]), f"indicator {i}")
+    df = merge_temp_month(df, TEMP_FILE, "Jul")
+    return df.rename(columns={"Jul": "July max temp (F)"})
+
+
+def engine(base: pd.DataFrame, n: int) -> pd.DataFrame:
+    indicators = [Indicator(base, "Age-adjusted rate per 100,000", "Emergency Visits / 100000", year=None)]
+    indicators += [Indicator(os.path.join(DATA, CSV_FILES[i % len(CSV_FILES)]), "Value", f"indicator {i}",
+                             unit=RATE if "Hospital_beds" in CSV_FILES[i % len(CSV_FILES)] else PERCENT)
+                   for i in range(n)]
+    indicators.append(Indicator(TEMP_FILE, "Jul", "July max temp (F)", year=None))
+    counties = base["County"].iloc[1:].tolist()
+    return build_county_table(indicators, counties)
+
+
+def best_time(fn, base, n: int, repeat: int) -> float:
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(base, n)
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--counts", type=int, nargs="+", default=[4, 9, 18, 36, 72])
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    base = pd.read_excel(ED_FILE).rename(columns={"Counties": "County"})
+    base = base[["County", "Age-adjusted rate per 100,000"]]
+
+    # Same table either way (the chain keeps the statewide row until the first inner join)
+    a = chained(base, len(CSV_FILES)).set_index("County")
+    b = engine(base, len(CSV_FILES)).set_index("County")
+    assert a.index.equals(b.index)
+    for i in range(len(CSV_FILES)):
+        # The chain keeps the raw strings ("74.35%"), the engine parses them to float64
+        chained_values = pd.to_numeric(a[f"indicator {i}"].str.rstrip("%"), errors="coerce").to_numpy(np.float64)
+        np.testing.assert_array_equal(chained_values, b[f"indicator {i}"].to_numpy())
+    np.testing.assert_allclose(a["July max temp (F)"].to_numpy(float), b["July max temp (F)"].to_numpy(float))
+
+    print(f"{'indicators':>10} {'chained ms':>11} {'engine ms':>10} {'speedup':>8}")
+    for n in args.counts:
+        t_chain = best_time(chained, base, n, args.repeat)
+        t_engine = best_time(engine, base, n, args.repeat)
+        print(f"{n:>10} {t_chain * 1000:>11.1f} {t_engine * 1000:>10.1f} {t_chain / t_engine:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
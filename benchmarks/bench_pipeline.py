@@ -0,0 +1,490 @@
+import argparse
+import gc
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DATA = os.path.join(REPO, "data")
+sys.path.insert(0, REPO)
+sys.path.insert(0, os.path.join(DATA, "scripts"))
+
+from climatology import build_climatology  # noqa: E402
+from climdiv import MONTHS, parse_climdiv  # noqa: E402
+from climdiv_panel import build_panel  # noqa: E402
+from cvi_stream import stream_cvi  # noqa: E402
+from tract_aggregate import aggregate_tracts  # noqa: E402
+
+from src.artifacts import CVI_TRACTS_SNAPSHOT  # noqa: E402
+
+
+# End-to-end benchmark of the pipeline, one stage at a time
+# Every stage runs in its own freshly spawned process, so its peak RSS is not inherited from an
+# earlier stage. Inside that process the stage's inputs are prepared first (not timed), the peak RSS
+# mark is reset, and the stage runs repeat times for the wall time. One more run under tracemalloc
+# gives the peak of the memory Python and numpy allocated, and the memory blocks the stage allocated
+# and still held when it returned (tracemalloc does not see every buffer allocated in C, e.g. by
+# openpyxl's XML parser or pyarrow, the RSS figures do).
+# --scale N runs the stages on synthetic inputs N times the bundled ones: every state of the climdiv
+# normals as a 13 * N year history, N copies of the California tracts in a national CVI workbook,
+# N copies of the county sources and of the county table. Synthetic inputs are written once per
+# scale into the work directory and reused.
+# Results are written as JSON. With --baseline an earlier result file is compared stage by stage,
+# and the exit status is 1 when a stage got slower or bigger by more than --tolerance.
+# Usage: python benchmarks/bench_pipeline.py [--scale N] [--stages ...] [--repeat N] [--out FILE]
+#                                            [--baseline FILE] [--tolerance 0.25]
+
+NORMALS = {
+    "tmax": os.path.join(DATA, "climdiv-norm-tmaxcy-v1.0.0-20250905.txt"),
+    "cdd": os.path.join(DATA, "climdiv-norm-cddccy-v1.0.0-20250905.txt"),
+}
+# Years of synthetic climdiv history per unit of scale, the last year is LAST_YEAR
+YEARS_PER_SCALE = 13
+LAST_YEAR = 2024
+# The national CVI workbook has about 9 times the California tracts, the other states are copies
+OTHER_STATES = ["AL", "AZ", "CO", "FL", "IL", "NY", "TX", "WA"]
+WORK_DIR = os.path.join(tempfile.gettempdir(), "heat_pipeline_bench")
+
+
+# Synthetic inputs
+
+# A climdiv county history for every county of a normals file: the 1991-2020 normals plus noise for
+# each of n_years years, written in the fixed-width NOAA layout
+def synthetic_climdiv(normals: str, out: str, n_years: int, seed: int = 0):
+    data = parse_climdiv(normals)
+    keep = np.flatnonzero(data["year"] == 10)
+    rng = np.random.default_rng(seed)
+    with open(normals) as f:
+        first = f.readline()
+    element = first[5:7]
+
+    with open(out, "w") as f:
+        for year in range(LAST_YEAR - n_years + 1, LAST_YEAR + 1):
+            values = data["values"][keep] + rng.normal(0, 2, (len(keep), len(MONTHS)))
+            for state, fips, row in zip(data["state"][keep], data["fips"][keep], values):
+                f.write(f"{state:02d}{fips:03d}{element}{year:04d}" + "".join(f"{v:7.2f}" for v in row) + "\n")
+
+
+# California tract table committed with the repository (the Master CVI workbook is not)
+def cvi_tracts() -> pd.DataFrame:
+    return pd.read_excel(CVI_TRACTS_SNAPSHOT)
+
+
+# A Master CVI style workbook: the California tracts copies times, then the same tracts once for each
+# of OTHER_STATES (the rows the CVI stage filters out)
+def synthetic_cvi_workbook(out: str, copies: int):
+    from openpyxl import Workbook
+
+    cvi = cvi_tracts().drop(columns=["Food Access"])
+    header = ["State"] + list(cvi.columns)
+    rows = list(cvi.itertuples(index=False, name=None))
+
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet("CVI")
+    ws.append(header)
+    for state in ["CA"] * copies + OTHER_STATES:
+        for row in rows:
+            ws.append((state,) + row)
+    wb.save(out)
+
+
+# copies of a county keyed table, the county names of copy i > 0 get a " #i" suffix
+def replicate_counties(df: pd.DataFrame, copies: int, key: str = "County") -> pd.DataFrame:
+    if copies == 1:
+        return df
+    parts = [df]
+    for i in range(1, copies):
+        part = df.copy()
+        part[key] = part[key].astype(str) + f" #{i}"
+        parts.append(part)
+    return pd.concat(parts, ignore_index=True)
+
+
+# The Excel indicator sheets with their rows replicated, as new workbooks
+def synthetic_sheets(work: str, copies: int) -> dict:
+    from cleanup_with_temperature import FILE_INDICATORS
+
+    sheets = {}
+    for file in dict.fromkeys(str(ind.source) for ind in FILE_INDICATORS if str(ind.source).endswith(".xlsx")):
+        if copies == 1:
+            sheets[file] = file
+            continue
+        out = os.path.join(work, os.path.basename(file))
+        if not os.path.exists(out):
+            df = pd.read_excel(file)
+            key = "Counties" if "Counties" in df.columns else "County"
+            replicate_counties(df, copies, key).to_excel(out, index=False)
+        sheets[file] = out
+    return sheets
+
+
+# Paths of the inputs of every stage at this scale, writing the synthetic ones that are missing
+def prepare_inputs(scale: int, work_dir: str = WORK_DIR) -> dict:
+    work = os.path.join(work_dir, f"scale-{scale}")
+    os.makedirs(work, exist_ok=True)
+
+    climdiv = {}
+    for element, normals in NORMALS.items():
+        path = os.path.join(work, f"climdiv-{element}cy-synthetic.txt")
+        if not os.path.exists(path):
+            synthetic_climdiv(normals, path, YEARS_PER_SCALE * scale, seed=len(climdiv))
+        climdiv[element] = path
+
+    workbook = os.path.join(work, "Master CVI synthetic.xlsx")
+    if not os.path.exists(workbook):
+        synthetic_cvi_workbook(workbook, scale)
+
+    return {"scale": scale, "work": work, "climdiv": climdiv, "normals": NORMALS, "cvi_workbook": workbook,
+            "sheets": synthetic_sheets(work, scale)}
+
+
+# County table of the analysis, copies times with the indicators slightly perturbed per copy
+def county_table(scale: int, seed: int = 0) -> pd.DataFrame:
+    from src.EDA_County_Stats_with_temp import load_county_stats
+
+    df = replicate_counties(load_county_stats(), scale)
+    if scale > 1:
+        rng = np.random.default_rng(seed)
+        numeric = df.select_dtypes("number").columns
+        noise = rng.normal(0, 0.02, (len(df), len(numeric)))
+        noise[:len(df) // scale] = 0
+        df[numeric] = df[numeric] * (1 + noise)
+    return df
+
+
+# Stages, each a setup (untimed, builds the arguments from the inputs) and the timed call
+
+def setup_climdiv_parse(inputs):
+    return (inputs["climdiv"]["tmax"],)
+
+
+def setup_panel(inputs):
+    from climdiv_cache import load_climdiv
+
+    # parsing is the climdiv_parse stage, the panel reads the warm cache
+    for path in inputs["climdiv"].values():
+        load_climdiv(path)
+    return inputs["climdiv"], os.path.join(inputs["work"], "panel"), os.path.join(DATA, "county-to-climdivs.txt")
+
+
+def setup_climatology(inputs):
+    panel_dir = os.path.join(inputs["work"], "panel")
+    if not os.path.isdir(panel_dir):
+        build_panel(inputs["climdiv"], panel_dir)
+    return panel_dir, os.path.join(inputs["work"], "climatology"), inputs["normals"]
+
+
+def read_sheets(sheets, schemas):
+    from county_join import read_source
+
+    return {file: read_source(path, schemas[file]) for file, path in sheets.items()}
+
+
+def setup_excel_read(inputs):
+    from cleanup_with_temperature import FILE_INDICATORS
+    from county_join import source_schemas
+
+    return inputs["sheets"], source_schemas(FILE_INDICATORS)
+
+
+def join_counties(indicators, counties, frames):
+    from county_join import build_county_table
+
+    return build_county_table(indicators, counties, frames)
+
+
+def setup_indicator_join(inputs):
+    from cleanup_with_temperature import CA_COUNTY_FIPS, FILE_INDICATORS, TEMP_INDICATORS
+    from county_join import read_source, source_files, source_schemas
+
+    scale = inputs["scale"]
+    indicators = FILE_INDICATORS + TEMP_INDICATORS
+    schemas = source_schemas(indicators)
+    frames = {}
+    for file in source_files(indicators):
+        df = read_source(inputs["sheets"].get(file, file), schemas[file])
+        frames[file] = df if file in inputs["sheets"] else replicate_counties(df, scale)
+    counties = replicate_counties(pd.DataFrame({"County": list(CA_COUNTY_FIPS.values())}), scale)
+    return indicators, counties["County"].tolist(), frames
+
+
+def setup_cvi_filter(inputs):
+    from cleanup_with_temperature import FOOD_ACCESS_FILE
+
+    return inputs["cvi_workbook"], FOOD_ACCESS_FILE, os.path.join(inputs["work"], "cvi.parquet")
+
+
+def setup_cvi_aggregate(inputs):
+    from cleanup_with_temperature import CA_COUNTY_FIPS
+
+    cvi = cvi_tracts()
+    return pd.concat([cvi] * inputs["scale"], ignore_index=True), CA_COUNTY_FIPS, "FIPS Code", 6
+
+
+def fit_temperatures(x, y):
+    from src.EDA_County_Stats_with_temp import fit_linear_with_intercept_enforced
+
+    return fit_linear_with_intercept_enforced(x, y, [0], [1e6], ["July", "August", "max temp"],
+                                              y_min=np.nanmin(y), plot=False)
+
+
+def _heat_inputs(inputs):
+    from src.EDA_County_Stats_with_temp import august_col, emergency_frame, july_col, y_col
+
+    df = emergency_frame(county_table(inputs["scale"]))
+    july = df[july_col].to_numpy(dtype=float)
+    august = df[august_col].to_numpy(dtype=float)
+    return np.vstack([july, august, np.fmax(july, august)]), df[y_col].to_numpy(dtype=float)
+
+
+def setup_temperature_fit(inputs):
+    from src import result_cache
+
+    # the stage measures the fit, not a cache hit
+    result_cache.configure(enabled=False)
+    return _heat_inputs(inputs)
+
+
+def setup_threshold_sweep(inputs):
+    x, y = _heat_inputs(inputs)
+    return x[2], y
+
+
+def sweep_thresholds(x, y):
+    from src.threshold_sweep import threshold_sweep
+
+    return threshold_sweep(x, y, n_boot=200, workers=1)
+
+
+def setup_residuals(inputs):
+    return (county_table(inputs["scale"]),)
+
+
+def residuals(df):
+    from src.EDA_County_Stats_with_temp import residual_frame
+
+    return residual_frame(df)
+
+
+def setup_cv_regressions(inputs):
+    from src import result_cache
+    from src.EDA_County_Stats_with_temp import indicator_columns, residual_frame, split_residuals
+
+    result_cache.configure(enabled=False)
+    train, _ = split_residuals(residual_frame(county_table(inputs["scale"])))
+    return train, indicator_columns(train)
+
+
+def search_features(train, features):
+    from src.feature_search import feature_search
+
+    return feature_search(train, features, max_size=3, n_splits=5, n_repeats=10)
+
+
+# name -> (setup, stage), in pipeline order
+STAGES = {
+    "climdiv_parse": (setup_climdiv_parse, parse_climdiv),
+    "panel": (setup_panel, build_panel),
+    "climatology": (setup_climatology, build_climatology),
+    "excel_read": (setup_excel_read, read_sheets),
+    "indicator_join": (setup_indicator_join, join_counties),
+    "cvi_filter": (setup_cvi_filter, stream_cvi),
+    "cvi_aggregate": (setup_cvi_aggregate, aggregate_tracts),
+    "temperature_fit": (setup_temperature_fit, fit_temperatures),
+    "threshold_sweep": (setup_threshold_sweep, sweep_thresholds),
+    "residuals": (setup_residuals, residuals),
+    "cv_regressions": (setup_cv_regressions, search_features),
+}
+
+
+# Measurements, in the stage's own process
+
+def _status_kib(field: str):
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith(field + ":"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+
+# Linux resets the VmHWM peak on a write of 5 to clear_refs, elsewhere the peak covers the setup too
+def _reset_peak_rss():
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+    except OSError:
+        pass
+
+
+def _rss_mib() -> float:
+    kib = _status_kib("VmRSS")
+    return kib / 1024 if kib is not None else float("nan")
+
+
+def _peak_rss_mib() -> float:
+    kib = _status_kib("VmHWM")
+    if kib is None:
+        # ru_maxrss is in KiB on Linux and bytes on macOS
+        kib = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        kib = kib / 1024 if sys.platform == "darwin" else kib
+    return kib / 1024
+
+
+def measure_stage(name: str, inputs: dict, repeat: int, trace: bool) -> dict:
+    setup, stage = STAGES[name]
+    args = setup(inputs)
+    stage(*args)  # warm-up: imports, lazily built tables
+
+    gc.collect()
+    _reset_peak_rss()
+    rss_start = _rss_mib()
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        stage(*args)
+        times.append(time.perf_counter() - start)
+    result = {"best_s": min(times), "median_s": float(np.median(times)), "rss_start_mib": rss_start,
+              "peak_rss_mib": _peak_rss_mib()}
+    result["rss_growth_mib"] = max(result["peak_rss_mib"] - rss_start, 0.0)
+
+    if trace:
+        gc.collect()
+        tracemalloc.start()
+        before = tracemalloc.take_snapshot()
+        out = stage(*args)
+        after = tracemalloc.take_snapshot()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        diff = after.compare_to(before, "filename")
+        result["traced_peak_mib"] = peak / 2 ** 20
+        result["retained_mib"] = sum(stat.size_diff for stat in diff) / 2 ** 20
+        result["retained_blocks"] = sum(stat.count_diff for stat in diff)
+        del out
+    return result
+
+
+def _child(name, inputs, repeat, trace, queue):
+    try:
+        queue.put(measure_stage(name, inputs, repeat, trace))
+    except BaseException as exc:
+        queue.put({"error": f"{type(exc).__name__}: {exc}"})
+
+
+# Run one stage in a new process and return its measurements
+# A child that dies without sending them (killed, out of memory, crash in C) is reported as an error
+def run_stage(name: str, inputs: dict, repeat: int = 3, trace: bool = True) -> dict:
+    from queue import Empty
+
+    ctx = multiprocessing.get_context("spawn")
+    queue = ctx.Queue()
+    proc = ctx.Process(target=_child, args=(name, inputs, repeat, trace, queue))
+    proc.start()
+    while True:
+        try:
+            result = queue.get(timeout=1.0)
+            break
+        except Empty:
+            if not proc.is_alive():
+                # the result may have been sent just before the child exited
+                try:
+                    result = queue.get(timeout=1.0)
+                except Empty:
+                    result = {"error": f"stage process exited with code {proc.exitcode} without a result"}
+                break
+    proc.join()
+    return result
+
+
+# Reporting
+
+def environment() -> dict:
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=REPO, capture_output=True,
+                                text=True).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {"python": platform.python_version(), "numpy": np.__version__, "pandas": pd.__version__,
+            "platform": platform.platform(), "cpus": os.cpu_count(), "commit": commit}
+
+
+def print_result(name: str, r: dict):
+    if "error" in r:
+        print(f"{name:16s} failed: {r['error']}")
+        return
+    line = (f"{name:16s} best {r['best_s'] * 1000:9.1f} ms  median {r['median_s'] * 1000:9.1f} ms"
+            f"  peak RSS {r['peak_rss_mib']:7.1f} MiB (+{r['rss_growth_mib']:6.1f})")
+    if "traced_peak_mib" in r:
+        line += f"  traced peak {r['traced_peak_mib']:7.1f} MiB  retained {r['retained_blocks']:7d} blocks"
+    print(line)
+
+
+# Stages slower (best time) or bigger (RSS growth) than in baseline by more than tolerance
+def regressions(results: dict, baseline: dict, tolerance: float) -> list:
+    out = []
+    for name, r in results["stages"].items():
+        old = baseline.get("stages", {}).get(name)
+        if old is None or "error" in old or "error" in r:
+            continue
+        for key in ("best_s", "rss_growth_mib"):
+            # a few MiB of RSS growth is noise
+            floor = 8.0 if key == "rss_growth_mib" else 0.0
+            if r[key] > max(old[key], floor) * (1 + tolerance):
+                out.append(f"{name}: {key} {old[key]:.4g} -> {r[key]:.4g}")
+    return out
+
+
+def main():
+    parser = argparse.ArgumentParser(description="End-to-end pipeline benchmark, stage by stage in fresh processes")
+    parser.add_argument("--scale", type=int, default=1, help="size of the inputs, in multiples of the bundled data")
+    parser.add_argument("--stages", nargs="+", choices=list(STAGES), default=list(STAGES))
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--no-trace", action="store_true", help="skip the tracemalloc run")
+    parser.add_argument("--work", default=WORK_DIR, help="directory for the synthetic inputs")
+    parser.add_argument("--out", default=None, help="JSON results file (default bench_pipeline-scale<N>.json)")
+    parser.add_argument("--baseline", default=None, help="earlier JSON results to compare with")
+    parser.add_argument("--tolerance", type=float, default=0.25)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    inputs = prepare_inputs(args.scale, args.work)
+    print(f"inputs at scale {args.scale} ready in {time.perf_counter() - start:.1f} s ({inputs['work']})")
+
+    results = {"scale": args.scale, "repeat": args.repeat, "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+               "environment": environment(), "stages": {}}
+    for name in args.stages:
+        results["stages"][name] = run_stage(name, inputs, args.repeat, not args.no_trace)
+        print_result(name, results["stages"][name])
+
+    out = args.out or f"bench_pipeline-scale{args.scale}.json"
+    with open(out, "w") as f:
+        json.dump(results, f, indent=1)
+    print(f"wrote {out}")
+
+    failed = [name for name, r in results["stages"].items() if "error" in r]
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline.get("scale") != args.scale:
+            print(f"note: the baseline was run at scale {baseline.get('scale')}")
+        slower = regressions(results, baseline, args.tolerance)
+        for line in slower:
+            print("regression:", line)
+        failed += slower
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,196 @@
+import argparse
+import importlib
+import os
+import pickle
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO)
+
+from src import result_cache  # noqa: E402
+from src.result_cache import cached_call  # noqa: E402
+
+
+# Checks that src/result_cache.py misses whenever the result could differ (changed data, dtype,
+# shape, parameters or code) and hits otherwise, and that eviction removes the least recently used
+# entries and that unreadable entries are recomputed, then times a miss against a hit for the EDA fit
+# and the CV scores.
+# Every check runs against a scratch cache directory, .result_cache/ is not touched.
+# Usage: python benchmarks/bench_result_cache.py [--repeat N]
+
+CALLS = []
+
+
+def counted(x, threshold=80.0):
+    CALLS.append(threshold)
+    return float(np.sum(x)) + threshold
+
+
+# Number of times counted ran during call()
+def runs(call) -> int:
+    before = len(CALLS)
+    call()
+    return len(CALLS) - before
+
+
+def check_hits_and_misses():
+    x = np.arange(100, dtype=float)
+    assert runs(lambda: cached_call(counted, x)) == 1, "first call must run"
+    assert runs(lambda: cached_call(counted, x.copy())) == 0, "equal data must hit"
+    assert cached_call(counted, x) == counted(x), "a hit must return the stored result"
+
+    changed = x.copy()
+    changed[50] += 1e-9
+    assert runs(lambda: cached_call(counted, changed)) == 1, "changed data must miss"
+    assert runs(lambda: cached_call(counted, x.astype(np.float32))) == 1, "changed dtype must miss"
+    assert runs(lambda: cached_call(counted, x.reshape(10, 10))) == 1, "changed shape must miss"
+    assert runs(lambda: cached_call(counted, x, threshold=80.5)) == 1, "changed parameter must miss"
+    assert runs(lambda: cached_call(counted, x, 80.0)) == 1, "positional and keyword arguments are keyed apart"
+    assert runs(lambda: cached_call(counted, [x, x])) == 1
+    assert runs(lambda: cached_call(counted, [x, changed])) == 1, "containers must be hashed by content"
+    assert runs(lambda: cached_call(counted, [x.copy(), x.copy()])) == 0
+
+
+MODULE_SOURCE = "def fit(x):\n    return {body}\n"
+
+
+# Editing the module that defines a cached function must invalidate its entries
+def check_code_change(scratch: str):
+    path = os.path.join(scratch, "cached_module.py")
+    sys.path.insert(0, scratch)
+    try:
+        with open(path, "w") as f:
+            f.write(MODULE_SOURCE.format(body="x.sum()"))
+        module = importlib.import_module("cached_module")
+        x = np.arange(10.0)
+        assert cached_call(module.fit, x) == 45.0
+
+        with open(path, "w") as f:
+            f.write(MODULE_SOURCE.format(body="x.sum() * 2"))
+        # module hashes are memoized per process, a new run starts without them
+        result_cache._module_hashes.clear()
+        module = importlib.reload(module)
+        assert cached_call(module.fit, x) == 90.0, "edited code must miss"
+    finally:
+        sys.path.remove(scratch)
+        sys.modules.pop("cached_module", None)
+
+
+def entry_count(cache_dir: str) -> int:
+    return sum(name.endswith(".pkl") for name in os.listdir(cache_dir))
+
+
+# Past max_bytes the least recently used entries go first, and a hit counts as a use
+def check_eviction(cache_dir: str):
+    result_cache.configure(cache_dir=cache_dir, max_bytes=250_000)
+    result_cache.clear()
+    a, b, c = (np.full(12_000, v) for v in (1.0, 2.0, 3.0))  # ~100 kB pickled each
+
+    def big(x):
+        CALLS.append(None)
+        return x.copy()
+
+    # file mtimes are only a few ms fine on some file systems
+    for x in (a, b):
+        cached_call(big, x)
+        time.sleep(0.05)
+    assert runs(lambda: cached_call(big, a)) == 0
+    time.sleep(0.05)
+    cached_call(big, c)
+
+    assert entry_count(cache_dir) == 2, "the cache must stay under max_bytes"
+    assert runs(lambda: cached_call(big, a)) == 0, "the recently hit entry must survive"
+    assert runs(lambda: cached_call(big, c)) == 0, "the newest entry must survive"
+    assert runs(lambda: cached_call(big, b)) == 1, "the least recently used entry must be evicted"
+
+
+# Entries that cannot be loaded are misses: truncated or corrupt files, and pickles of classes that
+# no longer exist (renamed or moved in a refactor)
+def check_unreadable_entries(cache_dir: str):
+    result_cache.configure(cache_dir=cache_dir)
+    x = np.arange(7.0)
+    path = os.path.join(cache_dir, result_cache.cache_key(counted, (x,), {}) + ".pkl")
+    good = pickle.dumps(np.float64(counted(x)))
+    for name, data in [("empty", b""), ("truncated", good[:len(good) // 2]), ("garbage", b"not a pickle"),
+                       ("missing module", good.replace(b"numpy", b"nompy")),
+                       ("missing class", good.replace(b"scalar", b"scalax"))]:
+        cached_call(counted, x)
+        with open(path, "wb") as f:
+            f.write(data)
+        assert runs(lambda: cached_call(counted, x)) == 1, f"a {name} entry must be recomputed"
+        assert runs(lambda: cached_call(counted, x)) == 0, f"a {name} entry must be replaced"
+
+
+def check_disabled():
+    result_cache.configure(enabled=False)
+    try:
+        x = np.arange(3.0)
+        assert runs(lambda: cached_call(counted, x)) == 1
+        assert runs(lambda: cached_call(counted, x)) == 1, "a disabled cache must always run"
+    finally:
+        result_cache.configure(enabled=True)
+
+
+def best_time(fn, repeat: int) -> float:
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+# Miss (clear, then compute and store) against hit for the cached calls of the analysis
+def time_analysis(cache_dir: str, repeat: int):
+    from src.EDA_County_Stats_with_temp import (
+        FEATURES, _fit, august_col, emergency_frame, july_col, load_county_stats, residual_frame, y_col,
+    )
+    from src.feature_search import cv_scores, feature_subsets, kfold_masks
+
+    result_cache.configure(cache_dir=cache_dir)
+    df = load_county_stats()
+    em = emergency_frame(df)
+    july, august = em[july_col].to_numpy(dtype=float), em[august_col].to_numpy(dtype=float)
+    x = np.vstack([july, august, np.fmax(july, august)])
+    y = em[y_col].to_numpy(dtype=float)
+    fit_args = (x, y, np.array([0.0]), np.array([1e6]), 80.0, np.nanmin(y), 20000, None)
+
+    data = residual_frame(df)[FEATURES + ["Emergency Visits / 100000 temp residual"]].dropna()
+    X, target = data[FEATURES].to_numpy(dtype=float), data.iloc[:, -1].to_numpy(dtype=float)
+    cv_args = (X, target, feature_subsets(len(FEATURES), 4), kfold_masks(len(target), 5, 10, 25))
+
+    for name, fn, args in [("anchored fit", _fit, fit_args), ("cv_scores", cv_scores, cv_args)]:
+        def miss():
+            result_cache.clear()
+            cached_call(fn, *args)
+
+        cached_call(fn, *args)
+        hit = best_time(lambda: cached_call(fn, *args), repeat)
+        print(f"{name:14s} miss {best_time(miss, repeat) * 1000:8.2f} ms  hit {hit * 1000:8.2f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check the result cache and time a miss against a hit")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as scratch:
+        cache_dir = os.path.join(scratch, "cache")
+        result_cache.configure(cache_dir=cache_dir)
+        check_hits_and_misses()
+        check_code_change(scratch)
+        check_eviction(cache_dir)
+        check_unreadable_entries(cache_dir)
+        check_disabled()
+        print("hit, miss, code change, eviction and unreadable entry checks passed")
+
+        result_cache.configure(cache_dir=cache_dir)
+        time_analysis(cache_dir, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
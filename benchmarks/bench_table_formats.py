@@ -0,0 +1,51 @@
+import argparse
+import os
+import tempfile
+import time
+
+import pandas as pd
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+# Load times of the pipeline tables as Excel (openpyxl), Parquet and Arrow IPC (Feather)
+# Also writes each table in every format once to compare write times and file sizes.
+# Usage: python benchmarks/bench_table_formats.py [--repeat N]
+
+TABLES = ["County_Statistics_with_Temp", "California_CVI_dataset"]
+
+FORMATS = {
+    "xlsx": (lambda df, p: df.to_excel(p, index=False), pd.read_excel),
+    "parquet": (lambda df, p: df.to_parquet(p, index=False), pd.read_parquet),
+    "feather": (lambda df, p: df.to_feather(p), pd.read_feather),
+}
+
+
+def best_time(fn, repeat: int) -> float:
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"{'table':28s} {'format':8s} {'rows':>6s} {'write ms':>9s} {'read ms':>9s} {'size KiB':>9s}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for table in TABLES:
+            df = pd.read_excel(os.path.join(REPO, table + ".xlsx"))
+            for fmt, (write, read) in FORMATS.items():
+                path = os.path.join(tmp, f"{table}.{fmt}")
+                t_write = best_time(lambda: write(df, path), 1)
+                t_read = best_time(lambda: read(path), args.repeat)
+                print(f"{table:28s} {fmt:8s} {len(df):>6d} {t_write * 1000:>9.1f} {t_read * 1000:>9.1f}"
+                      f" {os.path.getsize(path) / 1024:>9.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,78 +1,57 @@
-import pandas as pd
-
-
-# Read a file and clean it up
-def cleanup_csv(file: str) -> pd.DataFrame:
-    df = pd.read_csv(file)
-    df = df.rename(columns={"End Year": "Year"})
-
-    # Keep only the most recent year if there are multiple
-    df = df[df["Year"] == df["Year"].max()]
-    df = df[["County", "Value"]]
-
-    return df
-
-
-# Merge with good names for the columns
-def merge_csv(df: pd.DataFrame, file: str, name: str):
-    df = pd.merge(df, cleanup_csv(file), how="inner", on=["County"], suffixes=(None, None))
-    df = df.rename(columns={"Value": name})
-
-    return df
-
-
-def merge_temp_month(left_df, csv_path, month, left_on="County", right_on="County"):
-    right = pd.read_csv(csv_path, usecols=[right_on, month])
-    right[right_on] = right[right_on].astype(str)
-    left = left_df.copy()
-    left[left_on] = left[left_on].astype(str)
-
-    left = left.merge(right, how="left", left_on=left_on, right_on=right_on)
-    return left
+import argparse
+import os
+import sys
+from functools import partial
 
+import numpy as np
+import pandas as pd
 
-# Slightly different work for the Excel sheets
-def cleanup_xlsx(file: str) -> pd.DataFrame:
-    df = pd.read_excel(file)
+from climdiv_cache import load_climdiv
+from climatology import anomaly_columns, anomaly_table, build_climatology, climatology_files
+from climdiv_panel import build_panel, panel_files
+from county_join import PERCENT, RATE, Indicator, build_county_table, read_source, source_files, source_schemas
+from cvi_stream import stream_cvi
+from ingest import Source, read_sources
+from pipeline import Stage, run_stages
+from tract_aggregate import aggregate_tracts
 
-    # Drop California aggregate row
-    # New way of doing it fixes issue that dropped Alameda
-    if 'County' in df.columns:
-        df = df[df['County'] == 'California']
+# The tables the analysis reads are written to the paths it reads them from (src/artifacts.py)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+from src.artifacts import (  # noqa: E402
+    COUNTY_STATS_FILE, COUNTY_STATS_REPORT, CVI_COUNTY_FILE, CVI_TRACTS_FILE, CVI_TRACTS_REPORT, CVI_TRACTS_SNAPSHOT,
+)
 
-    df = df[["Counties", "Age-adjusted rate per 100,000"]]
-    df = df.rename(columns={"Counties": "County"})
 
-    return df
+# Raw and built files live in data/, paths no longer depend on the working directory
+DATA_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 
 
-def merge_xlsx(df: pd.DataFrame, file: str, name: str):
-    df = pd.merge(df, cleanup_xlsx(file), how="left", on=["County"], suffixes=(None, None))
-    df = df.rename(columns={"Age-adjusted rate per 100,000": name})
+def data_file(name: str) -> str:
+    return os.path.join(DATA_DIR, name)
 
-    return df
 
+# State code 4 is California in the climdiv files
+CA_STATE_CODE = 4
 
-# Read a file and clean it up
-# Link to NOAA data https://www.ncei.noaa.gov/pub/data/cirs/climdiv/
 
-# returns df, all data in the file
-# also returns cal, only California data
-def cleanup_NOAA_txt(file: str) -> pd.DataFrame:
-    col_names = ["County Data", "Jan", "Feb", "Mar", "Apr", "May", "Jun",
-                 "Jul", "Aug", "Sep", "Oct", "Nov", "Dec"]
+# NOAA climdiv files: https://www.ncei.noaa.gov/pub/data/cirs/climdiv/
+# They are parsed by climdiv.py and the parsed arrays cached on disk (see climdiv_cache.py), so the
+# text is only parsed once per file version. load_climdiv(file, states=, years=, months=) loads just
+# the selected slice, build_temperatures below reads the two files through it.
 
+# Turns parsed climdiv arrays into a DataFrame
+# State Code is kept only when more than one state was loaded
+def climdiv_frame(data: dict, states=(CA_STATE_CODE,)) -> pd.DataFrame:
     # County Data interpretation: https://www.ncei.noaa.gov/pub/data/cirs/climdiv/county-readme.txt
-    df = pd.read_csv(file, delim_whitespace=True, names=col_names, dtype={"County Data": str})
-    df["State Code"] = df["County Data"].str[:2]
-    df["FIPS"] = df["County Data"].str[2:5]
-    df["Year"] = df["County Data"].str[-4:]
-
-    # State code "04" is California
-    cal = df[df["State Code"] == "04"]
-    cal = cal.drop(columns=['County Data', 'State Code'])
+    # State Code, FIPS and Year come back as integers (see climdiv.py), missing values as NaN
+    # Values are stored as float32, round back to the hundredths in the file so they print cleanly
+    df = pd.DataFrame(np.asarray(data["values"], dtype=np.float64).round(2), columns=data["months"])
+    if states is None or len(states) > 1:
+        df["State Code"] = data["state"]
+    df["FIPS"] = data["fips"]
+    df["Year"] = data["year"]
 
-    return df, cal
+    return df
 
 
 # Map of all california counties and their FIPS codes
@@ -98,78 +77,231 @@ CA_COUNTY_FIPS = {
 def addCountyName(df: pd.DataFrame) -> pd.DataFrame:
     if "County" in df.columns:
         return df
-    s = df["FIPS"].str.strip().str.zfill(3)
+    # FIPS may be numeric (climdiv parser) or a string, normalize to the 3 digit keys
+    s = df["FIPS"].astype(str).str.strip().str.zfill(3)
+    df["FIPS"] = s
     df["County"] = s.map(CA_COUNTY_FIPS)
     return df
 
 
-# We'll join all the county stats together
-
-# Start with the Excel sheets
-county_stats = cleanup_xlsx("../Emergency Department_Visits_Age-adjusted_rate_per_100000_2023_Counties.xlsx")
-county_stats = county_stats.rename(columns={"Age-adjusted rate per 100,000": "Emergency Visits / 100000"})
-
-county_stats = merge_xlsx(county_stats, "../Hospitalizations_Age-adjusted_rate_per_100000_2023_Counties.xlsx",
-                          "Hospitalizations / 100000")
-
-# Creates max temp and Cooling Degree Days (CDD) dataframes for each year (1895-2015)
-maxTempUS, maxTempCA = cleanup_NOAA_txt("../climdiv-tmaxcy-v1.0.0-20250905.txt")
-cddUS, cddCA = cleanup_NOAA_txt("../climdiv-cddccy-v1.0.0-20250905.txt")
-
-# Chose to drop months, based on a CDC manuscript doing the same when studying heat related illness
+# Chose to keep only May-September, based on a CDC manuscript doing the same when studying heat related illness
 # Vaidyanathan A, Gates A, Brown C, Prezzato E, Bernstein A. Heat-Related Emergency Department Visits
 # — United States, May–September 2023. MMWR Morb Mortal Wkly Rep 2024;73:324–329.
 # DOI: http://dx.doi.org/10.15585/mmwr.mm7315a1
-months_to_drop = ["Jan", "Feb", "Mar", "Apr", "Oct", "Nov", "Dec"]
-maxTempSuCA = maxTempCA.drop(columns=months_to_drop)
-cddSuCA = cddCA.drop(columns=months_to_drop)
+SUMMER_MONTHS = ["May", "Jun", "Jul", "Aug", "Sep"]
 
-# Dataset for 2023 CA max Temp and CDD
 # Align with 2023 heat illness data we have
-maxTempSu2023CA = maxTempSuCA[maxTempCA["Year"] == "2023"]
-maxTempSu2023CA = maxTempSu2023CA.drop(columns=['Year'])
-cddSu2023CA = cddSuCA[cddSuCA["Year"] == "2023"]
-cddSu2023CA = cddSu2023CA.drop(columns=['Year'])
-
-# Adds county names
-maxTempSu2023CACounty = addCountyName(maxTempSu2023CA)
-cddSu2023CACounty = addCountyName(cddSu2023CA)
-maxTempSu2023CACounty.to_csv('../maxTempSu2023CACounty.csv', index=False)
-cddSu2023CACounty.to_csv('../cddSu2023CACounty.csv', index=False)
-
-# Join the CSVs
-county_stats = merge_csv(county_stats, "../Avg_annual_energy_burden_percent_of_income_2018.csv",
-                         "Energy Burden % of Income")
-county_stats = merge_csv(county_stats, "../Avg_percent_of_imperviousness_2021.csv", "Imperviousness")
-county_stats = merge_csv(county_stats, "../Distance_to_parks_half-mile_2010_2015_2020.csv", "Park within 1/2 Mile")
-county_stats = merge_csv(county_stats, "../Hospital_beds_per_10000_population_2020.csv", "Hospital Beds / 10000")
-county_stats = merge_csv(county_stats, "../Housing_built_before_1980.csv", "Housing Built before 1980")
-county_stats = merge_csv(county_stats, "../Housing_insecurity_2022.csv", "Housing Insecurity")
-county_stats = merge_csv(county_stats, "../Lack_of_reliable_transportation_2022.csv", "Lack of Reliable Transportation")
-county_stats = merge_csv(county_stats, "../Percent_without_internet_2018-2022.csv", "% w/o Internet")
-county_stats = merge_csv(county_stats, "../Utility_services_threat_2022.csv", "Utility Services Threat")
-county_stats = merge_temp_month(county_stats, "../maxTempSu2023CACounty.csv", "Jul")
-county_stats = county_stats.rename(columns={"Jul": "July max temp (F)"})
-county_stats = merge_temp_month(county_stats, "../maxTempSu2023CACounty.csv", "Aug")
-county_stats = county_stats.rename(columns={"Aug": "August max temp (F)"})
-county_stats = merge_temp_month(county_stats, "../cddSu2023CACounty.csv", "Jul")
-county_stats = county_stats.rename(columns={"Jul": "July CDD"})
-county_stats = merge_temp_month(county_stats, "../cddSu2023CACounty.csv", "Aug")
-county_stats = county_stats.rename(columns={"Aug": "August CDD"})
-
-# Save it
-county_stats.to_excel("../County_Statistics_withTemp.xlsx", index=False)
+STUDY_YEAR = 2023
+
+MAX_TEMP_FILE = data_file("climdiv-tmaxcy-v1.0.0-20250905.txt")
+CDD_FILE = data_file("climdiv-cddccy-v1.0.0-20250905.txt")
+CVI_FILE = data_file("Master CVI Dataset - Oct 2023.xlsx")
+FOOD_ACCESS_FILE = data_file("Low_income_Low_Food_Access_by_Census_Tracts_2019_2015.csv")
+COUNTY_DIVISIONS_FILE = data_file("county-to-climdivs.txt")
+
+# Every county source is read once and aligned onto the California counties (see county_join.py)
+ED_RATE = "Age-adjusted rate per 100,000"
+FILE_INDICATORS = [
+    # Start with the Excel sheets
+    Indicator(data_file("Emergency Department_Visits_Age-adjusted_rate_per_100000_2023_Counties.xlsx"), ED_RATE,
+              "Emergency Visits / 100000", year=None),
+    Indicator(data_file("Hospitalizations_Age-adjusted_rate_per_100000_2023_Counties.xlsx"), ED_RATE,
+              "Hospitalizations / 100000", year=None),
+    # Then the CSVs, percentages are stored as numbers (74.35 for "74.35%")
+    Indicator(data_file("Avg_annual_energy_burden_percent_of_income_2018.csv"), "Value",
+              "Energy Burden % of Income", unit=PERCENT),
+    Indicator(data_file("Avg_percent_of_imperviousness_2021.csv"), "Value", "Imperviousness", unit=PERCENT),
+    Indicator(data_file("Distance_to_parks_half-mile_2010_2015_2020.csv"), "Value", "Park within 1/2 Mile",
+              unit=PERCENT),
+    Indicator(data_file("Hospital_beds_per_10000_population_2020.csv"), "Value", "Hospital Beds / 10000",
+              unit=RATE),
+    Indicator(data_file("Housing_built_before_1980.csv"), "Value", "Housing Built before 1980", unit=PERCENT),
+    Indicator(data_file("Housing_insecurity_2022.csv"), "Value", "Housing Insecurity", unit=PERCENT),
+    Indicator(data_file("Lack_of_reliable_transportation_2022.csv"), "Value", "Lack of Reliable Transportation",
+              unit=PERCENT),
+    Indicator(data_file("Percent_without_internet_2018-2022.csv"), "Value", "% w/o Internet", unit=PERCENT),
+    Indicator(data_file("Utility_services_threat_2022.csv"), "Value", "Utility Services Threat", unit=PERCENT),
+]
+
+
+MAX_TEMP_CSV = data_file("maxTempSu2023CACounty.csv")
+CDD_CSV = data_file("cddSu2023CACounty.csv")
+# Parquet is the artifact the analysis reads (typed, fast to load), the Excel copies are optional reports
+# The table paths (COUNTY_STATS_FILE, CVI_TRACTS_FILE, CVI_COUNTY_FILE and their report copies)
+# are imported from src/artifacts.py above
+
+# All states and years of the climdiv files as county x year x month cubes (see climdiv_panel.py)
+PANEL_DIR = data_file(".climdiv_panel")
+PANEL_SOURCES = {"tmax": MAX_TEMP_FILE, "cdd": CDD_FILE}
+NORMALS_FILES = {
+    "tmax": data_file("climdiv-norm-tmaxcy-v1.0.0-20250905.txt"),
+    "cdd": data_file("climdiv-norm-cddccy-v1.0.0-20250905.txt"),
+}
 
-# Now we will filter the Master CVI dataset
-CVI_df = pd.read_excel("../Master CVI Dataset - Oct 2023.xlsx")
-CVI_df = CVI_df[CVI_df.State == "CA"]
+# Per-county climatology of the panel (see climatology.py), and the anomaly features of the study
+# year taken from it, joined into county_stats with build --anomalies
+CLIMATOLOGY_DIR = data_file(".climatology")
+HEAT_ANOMALY_CSV = data_file("heatAnomalySu2023CACounty.csv")
+ANOMALY_ELEMENTS = {"tmax": "max temp", "cdd": "CDD"}
+ANOMALY_MONTHS = ["Jul", "Aug"]
+# degrees above the 1991-2020 normal, and above the 90th percentile of 1991-2020 (0 when below it)
+ANOMALY_FEATURES = {"anomaly": "above normal", "exceed_p90": "above p90"}
+
+# Records input/output hashes so unchanged stages are skipped (see pipeline.py)
+MANIFEST_FILE = data_file(".build_manifest.json")
+
+# Temperature columns taken from the summer CSVs
+TEMP_INDICATORS = [
+    Indicator(MAX_TEMP_CSV, "Jul", "July max temp (F)", year=None),
+    Indicator(MAX_TEMP_CSV, "Aug", "August max temp (F)", year=None),
+    Indicator(CDD_CSV, "Jul", "July CDD", year=None),
+    Indicator(CDD_CSV, "Aug", "August CDD", year=None),
+]
+
+ANOMALY_INDICATORS = [Indicator(HEAT_ANOMALY_CSV, column, column, year=None)
+                      for column in anomaly_columns(ANOMALY_ELEMENTS, ANOMALY_MONTHS, ANOMALY_FEATURES)]
+
+
+# Excel report copy of a table
+# float32 columns are widened and rounded so the report shows 18.7 rather than 18.700000762939453
+def write_excel_report(df: pd.DataFrame, path: str):
+    floats = df.select_dtypes(np.float32).columns
+    df.astype({col: np.float64 for col in floats}).round({col: 4 for col in floats}).to_excel(path, index=False)
 
-# And attach the Low Food Access data, since it's also organized by census tract
-low_food_access_df = pd.read_csv("../Low_income_Low_Food_Access_by_Census_Tracts_2019_2015.csv")
-low_food_access_df = low_food_access_df[low_food_access_df.Year == 2019]
-low_food_access_df = low_food_access_df[["CensusTract", "Food Access"]]
 
-CVI_df = pd.merge(CVI_df, low_food_access_df, how="left", left_on=["FIPS Code"], right_on=["CensusTract"])
-CVI_df = CVI_df.drop(["State", "CensusTract"], axis=1)
+# Each stage reads its own sources concurrently (see ingest.py)
+# Excel and fixed-width parsing are CPU-bound and go to worker processes, csv reads to threads
 
-CVI_df.to_excel("../California_CVI_dataset.xlsx", index=False)
+# Creates 2023 California max temp and Cooling Degree Days (CDD) tables for the summer months
+def build_temperatures(workers: int = None):
+    selection = {"states": (CA_STATE_CODE,), "years": (STUDY_YEAR, STUDY_YEAR), "months": SUMMER_MONTHS}
+    raw = read_sources({
+        MAX_TEMP_FILE: Source(load_climdiv, (MAX_TEMP_FILE,), selection, cpu=True),
+        CDD_FILE: Source(load_climdiv, (CDD_FILE,), selection, cpu=True),
+    }, workers=workers)
+
+    maxTempSu2023CA = climdiv_frame(raw[MAX_TEMP_FILE]).drop(columns=['Year'])
+    cddSu2023CA = climdiv_frame(raw[CDD_FILE]).drop(columns=['Year'])
+
+    # Adds county names
+    maxTempSu2023CACounty = addCountyName(maxTempSu2023CA)
+    cddSu2023CACounty = addCountyName(cddSu2023CA)
+    maxTempSu2023CACounty.to_csv(MAX_TEMP_CSV, index=False)
+    cddSu2023CACounty.to_csv(CDD_CSV, index=False)
+
+
+# We'll join all the county stats together
+# With anomalies=True the heat anomaly features of the climatology stage are added as columns
+def build_county_stats(workers: int = None, excel: bool = False, anomalies: bool = False):
+    indicators = county_indicators(anomalies)
+    schemas = source_schemas(indicators)
+    raw = read_sources({file: Source(read_source, (file, schemas[file]), cpu=file.endswith(".xlsx"))
+                        for file in source_files(indicators)}, workers=workers)
+    county_stats = build_county_table(indicators, counties=list(CA_COUNTY_FIPS.values()), frames=raw)
+
+    # Save it
+    county_stats.to_parquet(COUNTY_STATS_FILE, index=False)
+    if excel:
+        write_excel_report(county_stats, COUNTY_STATS_REPORT)
+
+
+# Now we will filter the Master CVI dataset
+# The national workbook is streamed (see cvi_stream.py): rows of other states are dropped while reading,
+# and the Low Food Access data, also organized by census tract, is attached per chunk
+def build_cvi(excel: bool = False):
+    rows = stream_cvi(CVI_FILE, FOOD_ACCESS_FILE, CVI_TRACTS_FILE, state="CA", year=2019)
+    print(f"Wrote {rows} California tracts to {os.path.basename(CVI_TRACTS_FILE)}")
+
+    if excel:
+        write_excel_report(pd.read_parquet(CVI_TRACTS_FILE), CVI_TRACTS_REPORT)
+
+
+# National panel of every year in the climdiv files, the 2023 California tables above are one slice of it
+def build_climdiv_panel():
+    panel = build_panel(PANEL_SOURCES, PANEL_DIR, COUNTY_DIVISIONS_FILE)
+    print(f"Panel of {len(panel.counties)} counties, {panel.years[0]}-{panel.years[-1]}")
+
+
+# Climatology of the panel, then the anomaly features of the study year and months for California
+def build_heat_anomalies():
+    clim = build_climatology(PANEL_DIR, CLIMATOLOGY_DIR, NORMALS_FILES)
+    table = anomaly_table(clim, ANOMALY_ELEMENTS, CA_STATE_CODE, STUDY_YEAR, ANOMALY_MONTHS, ANOMALY_FEATURES)
+    # values are float32, round back to the hundredths of the climdiv files
+    addCountyName(table.round(2)).to_csv(HEAT_ANOMALY_CSV, index=False)
+
+
+# The tract table cvi_counties reads: what the cvi stage writes when it can run (the workbook is in
+# data/) or has run, otherwise the snapshot committed with the repository
+def cvi_tracts_source() -> str:
+    if os.path.exists(CVI_FILE) or os.path.exists(CVI_TRACTS_FILE):
+        return CVI_TRACTS_FILE
+    return CVI_TRACTS_SNAPSHOT
+
+
+# Tract level CVI and food access aggregated to the counties, one row per county in CA_COUNTY_FIPS
+# The CVI has no population column, so every tract weighs the same (see tract_aggregate.py)
+def build_cvi_counties(tracts: str = CVI_TRACTS_FILE):
+    cvi = pd.read_parquet(tracts) if tracts.endswith(".parquet") else pd.read_excel(tracts)
+    features = aggregate_tracts(cvi, CA_COUNTY_FIPS, state=6)
+    features.to_parquet(CVI_COUNTY_FILE, index=False)
+    print(f"Wrote {features.shape[1] - 1} county features from {len(cvi)} tracts")
+
+
+def county_indicators(anomalies: bool = False) -> list:
+    return FILE_INDICATORS + TEMP_INDICATORS + (ANOMALY_INDICATORS if anomalies else [])
+
+
+# Paths of sibling modules a stage runs, hashed with the stage function (see pipeline.py)
+def module_files(*modules) -> tuple:
+    here = os.path.dirname(os.path.abspath(__file__))
+    return tuple(os.path.join(here, m) for m in modules)
+
+
+# The rebuild as a dependency graph, in execution order
+# With excel=True the Excel reports become stage outputs too
+# With anomalies=True county_stats also depends on the heat anomaly table
+def build_stages(workers: int = None, excel: bool = False, anomalies: bool = False) -> list:
+    return [
+        Stage("temperature", partial(build_temperatures, workers),
+              inputs=[MAX_TEMP_FILE, CDD_FILE], outputs=[MAX_TEMP_CSV, CDD_CSV],
+              code=module_files("climdiv.py", "climdiv_cache.py", "ingest.py") + (climdiv_frame, addCountyName)),
+        Stage("panel", build_climdiv_panel,
+              inputs=list(PANEL_SOURCES.values()) + [COUNTY_DIVISIONS_FILE],
+              outputs=panel_files(PANEL_DIR, PANEL_SOURCES),
+              code=module_files("climdiv.py", "climdiv_cache.py", "climdiv_panel.py")),
+        Stage("climatology", build_heat_anomalies,
+              inputs=panel_files(PANEL_DIR, PANEL_SOURCES) + list(NORMALS_FILES.values()),
+              outputs=climatology_files(CLIMATOLOGY_DIR, PANEL_SOURCES) + [HEAT_ANOMALY_CSV],
+              code=module_files("climatology.py") + (addCountyName,)),
+        Stage("county_stats", partial(build_county_stats, workers, excel, anomalies),
+              inputs=source_files(county_indicators(anomalies)),
+              outputs=[COUNTY_STATS_FILE] + ([COUNTY_STATS_REPORT] if excel else []),
+              code=module_files("county_join.py", "ingest.py") + (county_indicators, write_excel_report)),
+        Stage("cvi", partial(build_cvi, excel),
+              inputs=[CVI_FILE, FOOD_ACCESS_FILE],
+              outputs=[CVI_TRACTS_FILE] + ([CVI_TRACTS_REPORT] if excel else []),
+              code=module_files("cvi_stream.py") + (write_excel_report,)),
+        Stage("cvi_counties", partial(build_cvi_counties, cvi_tracts_source()),
+              inputs=[cvi_tracts_source()], outputs=[CVI_COUNTY_FILE],
+              code=module_files("tract_aggregate.py")),
+    ]
+
+
+def main(workers: int = None, force: bool = False, only: list = None, excel: bool = False,
+         anomalies: bool = False):
+    run_stages(build_stages(workers, excel, anomalies), MANIFEST_FILE, force=force, only=only)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rebuild the county and CVI tables from the raw sources")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="worker processes/threads for reading sources (default: CPU count, 1 = sequential)")
+    parser.add_argument("--force", action="store_true", help="rebuild every stage even if its inputs are unchanged")
+    parser.add_argument("--stage", action="append", dest="only", metavar="NAME",
+                        help="only consider this stage (repeatable): temperature, panel, climatology, county_stats, cvi, "
+                             "cvi_counties")
+    parser.add_argument("--excel", action="store_true", help="also write the Excel report copies of the tables")
+    parser.add_argument("--anomalies", action="store_true",
+                        help="add the heat anomaly features of the climatology stage to county_stats")
+    args = parser.parse_args()
+    main(workers=args.workers, force=args.force, only=args.only, excel=args.excel, anomalies=args.anomalies)
@@ -0,0 +1,234 @@
+import calendar
+import json
+import os
+import shutil
+import tempfile
+import warnings
+from typing import NamedTuple
+
+import numpy as np
+
+from climdiv import month_indices
+from climdiv_panel import COUNTY_ID_BASE, load_panel, read_normals
+
+
+# Precomputed reference values for the climdiv panel (climdiv_panel.py)
+# For every element and county: the NOAA normals, the mean, standard deviation and percentiles of
+# each calendar month over a base period, and a trailing rolling mean for every year (the baseline
+# a year is compared with, excluding the year itself). They are stored as .npy arrays on the panel's
+# county index, and a dense county id -> row table makes a lookup of any county/year/month a few
+# array reads, without touching the raw files again.
+# Arrays are computed CHUNK_COUNTIES counties at a time, so memory stays bounded for the national panel.
+
+CLIMATOLOGY_VERSION = 1
+CHUNK_COUNTIES = 256
+BASE_YEARS = (1991, 2020)
+WINDOW = 30
+PERCENTILES = (90, 95)
+
+
+class Climatology(NamedTuple):
+    counties: np.ndarray
+    years: np.ndarray
+    # {element: (counties, years, 12) observed values}, the panel cubes
+    values: dict
+    # {element: (counties, 12)}
+    normals: dict
+    mean: dict
+    std: dict
+    # {element: (counties, 12, len(percentiles))}
+    percentiles: dict
+    # {element: (counties, years, 12)} mean of the window years before each year
+    baseline: dict
+    levels: tuple
+    # county id -> row, -1 for ids outside the panel
+    rows: np.ndarray
+
+
+# Trailing mean of the window years before each year, NaN aware, along axis 1 of (counties, years, 12)
+def rolling_baseline(cube: np.ndarray, window: int = WINDOW, min_years: int = None) -> np.ndarray:
+    if min_years is None:
+        min_years = window // 2
+    valid = ~np.isnan(cube)
+    zeros = np.zeros((cube.shape[0], 1, cube.shape[2]))
+    total = np.concatenate([zeros, np.cumsum(np.where(valid, cube, 0.0), axis=1)], axis=1)
+    count = np.concatenate([zeros, np.cumsum(valid, axis=1)], axis=1)
+
+    # years [y - window, y) are total[y] - total[y - window]
+    end = np.arange(cube.shape[1])
+    start = np.maximum(end - window, 0)
+    n = count[:, end] - count[:, start]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        out = (total[:, end] - total[:, start]) / n
+    out[n < min_years] = np.nan
+    return out.astype(np.float32)
+
+
+# Memory-mapped float32 output array <name>_<element>.npy in out_dir
+def _output(out_dir: str, name: str, element: str, shape) -> np.ndarray:
+    return np.lib.format.open_memmap(os.path.join(out_dir, f"{name}_{element}.npy"), mode="w+",
+                                     dtype=np.float32, shape=shape)
+
+
+def _base_slice(years: np.ndarray, base_years) -> slice:
+    first = int(years[0])
+    return slice(max(int(base_years[0]) - first, 0), max(int(base_years[1]) - first + 1, 0))
+
+
+# Compute the climatology of every element of the panel in panel_dir into out_dir
+# normals_files maps elements to their climdiv normals file, period is the normals period code
+def build_climatology(panel_dir: str, out_dir: str, normals_files: dict = None, period: int = 10,
+                      base_years=BASE_YEARS, window: int = WINDOW, percentiles=PERCENTILES,
+                      chunk_counties: int = CHUNK_COUNTIES) -> Climatology:
+    panel = load_panel(panel_dir)
+    counties = np.asarray(panel.counties)
+    n = len(counties)
+    base = _base_slice(panel.years, base_years)
+
+    parent = os.path.dirname(os.path.abspath(out_dir))
+    os.makedirs(parent, exist_ok=True)
+    tmp = tempfile.mkdtemp(dir=parent, prefix=".tmp-")
+    try:
+        for element, cube in panel.values.items():
+            mean = _output(tmp, "mean", element, (n, 12))
+            std = _output(tmp, "std", element, (n, 12))
+            pct = _output(tmp, "percentiles", element, (n, 12, len(percentiles)))
+            baseline = _output(tmp, "baseline", element, cube.shape)
+            for lo in range(0, n, chunk_counties):
+                chunk = np.asarray(cube[lo:lo + chunk_counties], dtype=np.float64)
+                base_values = chunk[:, base]
+                if base_values.shape[1] == 0:
+                    # the panel does not reach the base period
+                    for array in (mean, std, pct):
+                        array[lo:lo + chunk_counties] = np.nan
+                    baseline[lo:lo + chunk_counties] = rolling_baseline(chunk, window)
+                    continue
+                # counties without data in the base period get NaN, quietly
+                with warnings.catch_warnings():
+                    warnings.simplefilter("ignore", RuntimeWarning)
+                    mean[lo:lo + chunk_counties] = np.nanmean(base_values, axis=1)
+                    std[lo:lo + chunk_counties] = np.nanstd(base_values, axis=1)
+                    pct[lo:lo + chunk_counties] = np.moveaxis(
+                        np.nanpercentile(base_values, percentiles, axis=1), 0, -1)
+                baseline[lo:lo + chunk_counties] = rolling_baseline(chunk, window)
+            for array in (mean, std, pct, baseline):
+                array.flush()
+            del mean, std, pct, baseline
+
+            normals = np.full((n, 12), np.nan, dtype=np.float32)
+            if normals_files and element in normals_files:
+                normals = read_normals(normals_files[element], counties, period)
+            np.save(os.path.join(tmp, f"normals_{element}.npy"), normals)
+
+        with open(os.path.join(tmp, "meta.json"), "w") as f:
+            json.dump({"version": CLIMATOLOGY_VERSION, "panel": os.path.abspath(panel_dir),
+                       "elements": list(panel.values), "base_years": list(base_years), "window": window,
+                       "percentiles": list(percentiles), "normals_period": period}, f, indent=1)
+
+        if os.path.isdir(out_dir):
+            shutil.rmtree(out_dir)
+        os.replace(tmp, out_dir)
+    except BaseException:
+        shutil.rmtree(tmp, ignore_errors=True)
+        raise
+
+    return load_climatology(out_dir)
+
+
+# Files build_climatology writes for these elements, for listing them as stage outputs
+def climatology_files(out_dir: str, elements) -> list:
+    names = [f"{kind}_{element}" for element in elements
+             for kind in ("normals", "mean", "std", "percentiles", "baseline")]
+    return [os.path.join(out_dir, name + ".npy") for name in names] + [os.path.join(out_dir, "meta.json")]
+
+
+def load_climatology(out_dir: str, mmap: bool = True) -> Climatology:
+    with open(os.path.join(out_dir, "meta.json")) as f:
+        meta = json.load(f)
+    panel = load_panel(meta["panel"], mmap)
+    mode = "r" if mmap else None
+
+    def load(kind):
+        return {element: np.load(os.path.join(out_dir, f"{kind}_{element}.npy"), mmap_mode=mode)
+                for element in meta["elements"]}
+
+    counties = np.asarray(panel.counties)
+    rows = np.full(int(counties.max()) + 1 if len(counties) else 1, -1, dtype=np.int64)
+    rows[counties] = np.arange(len(counties))
+
+    return Climatology(counties=counties, years=np.asarray(panel.years), values=panel.values,
+                       normals=load("normals"), mean=load("mean"), std=load("std"),
+                       percentiles=load("percentiles"), baseline=load("baseline"),
+                       levels=tuple(meta["percentiles"]), rows=rows)
+
+
+# Rows of county ids (state code * 1000 + FIPS), -1 when the panel has no such county
+def county_rows(clim: Climatology, counties) -> np.ndarray:
+    ids = np.asarray(counties, dtype=np.int64)
+    inside = (ids >= 0) & (ids < len(clim.rows))
+    return np.where(inside, clim.rows[np.where(inside, ids, 0)], -1)
+
+
+# Reference values of element for any mix of counties, years and months (broadcast together)
+# months are names or 1-based numbers. Returns a dict of arrays: value, normal, anomaly (value - normal),
+# zscore (against the base period), baseline, above_baseline (value - baseline), p<level> and
+# exceed_p<level> (degrees above that percentile, 0 below it). Unknown counties or years give NaN.
+def lookup(clim: Climatology, element: str, counties, years, months) -> dict:
+    month = np.asarray(month_indices(np.atleast_1d(months))).reshape(np.shape(months))
+    row, year, month = np.broadcast_arrays(county_rows(clim, counties), np.asarray(years, dtype=np.int64) - clim.years[0],
+                                           month)
+    ok = (row >= 0) & (year >= 0) & (year < len(clim.years))
+    r, y = np.where(ok, row, 0), np.where(ok, year, 0)
+
+    def pick(array, *index):
+        return np.where(ok, np.asarray(array[index], dtype=np.float64), np.nan)
+
+    value = pick(clim.values[element], r, y, month)
+    normal = pick(clim.normals[element], r, month)
+    mean = pick(clim.mean[element], r, month)
+    std = pick(clim.std[element], r, month)
+    baseline = pick(clim.baseline[element], r, y, month)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        out = {
+            "value": value,
+            "normal": normal,
+            "anomaly": value - normal,
+            "zscore": (value - mean) / std,
+            "baseline": baseline,
+            "above_baseline": value - baseline,
+        }
+    for k, level in enumerate(clim.levels):
+        threshold = pick(clim.percentiles[element], r, month, k)
+        out[f"p{level}"] = threshold
+        out[f"exceed_p{level}"] = np.where(np.isnan(value) | np.isnan(threshold), np.nan,
+                                           np.maximum(value - threshold, 0))
+    return out
+
+
+# Degrees above normal for one county (state code, county FIPS), year and month
+def degrees_above_normal(clim: Climatology, element: str, state: int, fips: int, year: int, month) -> float:
+    return float(lookup(clim, element, state * COUNTY_ID_BASE + fips, year, month)["anomaly"])
+
+
+# Column names of anomaly_table, "<Month> <element label> <feature label>"
+# elements and features map element names and lookup keys to labels,
+# e.g. {"tmax": "max temp"} and {"anomaly": "above normal"} give "July max temp above normal"
+def anomaly_columns(elements: dict, months, features: dict) -> list:
+    return [f"{calendar.month_name[month_indices([month])[0] + 1]} {label} {suffix}"
+            for label in elements.values() for month in months for suffix in features.values()]
+
+
+# Monthly heat anomaly features of one state and year, one row per county FIPS of that state
+def anomaly_table(clim: Climatology, elements: dict, state: int, year: int, months, features: dict):
+    import pandas as pd
+
+    lo, hi = np.searchsorted(clim.counties, [state * COUNTY_ID_BASE, (state + 1) * COUNTY_ID_BASE])
+    counties = clim.counties[lo:hi]
+    columns = iter(anomaly_columns(elements, months, features))
+    table = {"FIPS": counties % COUNTY_ID_BASE}
+    for element in elements:
+        for month in months:
+            found = lookup(clim, element, counties, year, month)
+            for key in features:
+                table[next(columns)] = found[key]
+    return pd.DataFrame(table)
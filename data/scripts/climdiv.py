@@ -0,0 +1,170 @@
+import numpy as np
+
+
+# Fixed-width parser for the NOAA climdiv county and normals files
+# Record layout: https://www.ncei.noaa.gov/pub/data/cirs/climdiv/county-readme.txt
+#   cols 1-2 state code, 3-5 county FIPS, 6-7 element code, 8-11 year (or normals period code),
+#   then twelve right-justified 7 char month values
+# The file is read as one byte buffer and every field is decoded with array arithmetic,
+# so no per-row Python string objects are created.
+
+ID_WIDTH = 11
+VALUE_WIDTH = 7
+N_MONTHS = 12
+RECORD_WIDTH = ID_WIDTH + VALUE_WIDTH * N_MONTHS
+
+MONTHS = ["Jan", "Feb", "Mar", "Apr", "May", "Jun", "Jul", "Aug", "Sep", "Oct", "Nov", "Dec"]
+
+# Element codes from county-readme.txt
+PRECIPITATION = 1
+AVERAGE_TEMPERATURE = 2
+HEATING_DEGREE_DAYS = 25
+COOLING_DEGREE_DAYS = 26
+MAXIMUM_TEMPERATURE = 27
+MINIMUM_TEMPERATURE = 28
+
+# Missing value markers (county-readme.txt and normals-readme.txt)
+# -9.99 only means missing for precipitation, it is a valid temperature
+MISSING_SENTINELS = (-99.99, -99.90, -9999.0)
+PRECIPITATION_SENTINEL = -9.99
+
+_NEWLINE = ord("\n")
+_ZERO = ord("0")
+_DOT = ord(".")
+_MINUS = ord("-")
+
+_POW10 = 10.0 ** np.arange(VALUE_WIDTH)
+
+# Rows decoded per step, bounds the size of the temporary (rows x 12) arrays
+CHUNK_ROWS = 1 << 14
+
+
+# Returns the byte offset of every record in buf, skipping blank or truncated lines
+def _record_starts(buf: np.ndarray) -> np.ndarray:
+    ends = np.flatnonzero(buf == _NEWLINE)
+    if buf.size and buf[-1] != _NEWLINE:
+        ends = np.append(ends, buf.size)
+    starts = np.concatenate(([0], ends[:-1] + 1)).astype(np.int64)
+
+    return starts[(ends - starts) >= RECORD_WIDTH]
+
+
+# Returns a (rows x RECORD_WIDTH) uint8 matrix of the records starting at starts
+# Files with a constant line length are viewed in place, others are gathered into a copy
+def _record_matrix(buf: np.ndarray, starts: np.ndarray) -> np.ndarray:
+    n = starts.size
+    if n == 0:
+        return np.empty((0, RECORD_WIDTH), dtype=np.uint8)
+
+    steps = np.diff(starts)
+    if n == 1 or (steps == steps[0]).all():
+        stride = int(steps[0]) if n > 1 else RECORD_WIDTH
+        return np.lib.stride_tricks.as_strided(buf[starts[0]:], shape=(n, RECORD_WIDTH),
+                                               strides=(stride, 1), writeable=False)
+
+    return buf[starts[:, None] + np.arange(RECORD_WIDTH)]
+
+
+# Reads digit columns [lo, hi) of the ID field as one integer per row
+def _decode_int(ids: np.ndarray, lo: int, hi: int) -> np.ndarray:
+    out = np.zeros(ids.shape[0], dtype=np.int32)
+    for j in range(lo, hi):
+        out = out * 10 + (ids[:, j].astype(np.int32) - _ZERO)
+    return out
+
+
+# Decodes a (rows x 12 x 7) block of right-justified decimal fields such as "  58.50" or "   16."
+def _decode_values(fields: np.ndarray) -> np.ndarray:
+    # One contiguous (rows x 12) plane per character position keeps every step below a flat array op
+    planes = np.ascontiguousarray(fields.transpose(2, 0, 1))
+    shape = planes.shape[1:]
+    mantissa = np.zeros(shape, dtype=np.int32)
+    decimals = np.zeros(shape, dtype=np.int8)
+    after_dot = np.zeros(shape, dtype=bool)
+    negative = np.zeros(shape, dtype=bool)
+
+    for c in planes:
+        digit = c - np.uint8(_ZERO)
+        is_digit = digit <= 9
+        mantissa[is_digit] *= 10
+        mantissa += np.where(is_digit, digit, 0)
+        decimals += is_digit & after_dot
+        after_dot |= c == _DOT
+        negative |= c == _MINUS
+
+    values = mantissa / _POW10[decimals]
+    np.negative(values, out=values, where=negative)
+
+    return values
+
+
+def _mask_missing(values: np.ndarray, element: np.ndarray):
+    missing = np.isin(np.round(values, 2), MISSING_SENTINELS)
+    missing |= (element[:, None] == PRECIPITATION) & (np.round(values, 2) == PRECIPITATION_SENTINEL)
+    values[missing] = np.nan
+
+
+# Column positions for a month selection given as names ("Jul") or numbers (7), None means all
+def month_indices(months=None) -> np.ndarray:
+    if months is None:
+        return np.arange(N_MONTHS)
+    return np.array([MONTHS.index(m) if isinstance(m, str) else int(m) - 1 for m in months], dtype=np.intp)
+
+
+# Boolean row mask for a state selection and an inclusive (first, last) year range
+# Either bound of the range may be None
+def row_mask(state: np.ndarray, year: np.ndarray, states=None, years=None) -> np.ndarray:
+    mask = np.ones(state.shape[0], dtype=bool)
+    if states is not None:
+        mask &= np.isin(state, np.asarray(states, dtype=int))
+    if years is not None:
+        first, last = years
+        if first is not None:
+            mask &= year >= first
+        if last is not None:
+            mask &= year <= last
+    return mask
+
+
+# Parse a climdiv file (or its raw bytes) into numeric arrays
+# Returns dict with state, fips, element, year as integer arrays,
+# values as a (rows x months) float32 matrix with missing sentinels set to NaN
+# and months, the names of the value columns
+# states, years and months are pushed down into the scan: the ID field of every line is decoded
+# first and the month values are only decoded, and allocated, for the matching lines and months
+def parse_climdiv(source, states=None, years=None, months=None) -> dict:
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        buf = np.frombuffer(source, dtype=np.uint8)
+    else:
+        buf = np.fromfile(source, dtype=np.uint8)
+
+    starts = _record_starts(buf)
+    ids = buf[starts[:, None] + np.arange(ID_WIDTH)]
+    state = _decode_int(ids, 0, 2)
+    year = _decode_int(ids, 7, 11)
+
+    keep = row_mask(state, year, states, years)
+    if not keep.all():
+        starts, ids, state, year = starts[keep], ids[keep], state[keep], year[keep]
+    del keep
+
+    cols = month_indices(months)
+    n = starts.size
+    out = {
+        "state": state.astype(np.uint8),
+        "fips": _decode_int(ids, 2, 5).astype(np.uint16),
+        "element": _decode_int(ids, 5, 7).astype(np.uint8),
+        "year": year.astype(np.uint16),
+        "values": np.empty((n, cols.size), dtype=np.float32),
+        "months": [MONTHS[i] for i in cols],
+    }
+
+    for lo in range(0, n, CHUNK_ROWS):
+        hi = min(lo + CHUNK_ROWS, n)
+        chunk = _record_matrix(buf, starts[lo:hi])
+        fields = chunk[:, ID_WIDTH:].reshape(hi - lo, N_MONTHS, VALUE_WIDTH)[:, cols]
+        values = _decode_values(fields)
+        _mask_missing(values, out["element"][lo:hi])
+        out["values"][lo:hi] = values
+
+    return out
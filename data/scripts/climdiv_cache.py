@@ -0,0 +1,126 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+
+import numpy as np
+
+from climdiv import MONTHS, month_indices, parse_climdiv, row_mask
+
+
+# Persistent columnar cache for the NOAA climdiv county files
+# Each source file is parsed once into typed .npy arrays (state/FIPS/year codes and a float32
+# month matrix). Later runs load those arrays memory-mapped instead of re-parsing ~37k lines of text.
+# Cache entries are keyed by the source path, size and mtime, so editing or replacing a file
+# invalidates its entry automatically.
+
+CACHE_VERSION = 2
+CACHE_DIR_NAME = ".climdiv_cache"
+# Hex characters of source_key, entries are <file stem>-<key>
+KEY_CHARS = 16
+
+# Column name -> dtype stored on disk
+CACHE_COLUMNS = {
+    "state": np.uint8,
+    "fips": np.uint16,
+    "element": np.uint8,
+    "year": np.uint16,
+    "values": np.float32,
+}
+
+
+# Identifies the exact version of a source file
+# Changing the file contents changes its size and/or mtime, which gives a new key
+def source_key(path: str) -> str:
+    st = os.stat(path)
+    ident = f"{os.path.abspath(path)}|{st.st_size}|{st.st_mtime_ns}|v{CACHE_VERSION}"
+    return hashlib.sha1(ident.encode()).hexdigest()[:KEY_CHARS]
+
+
+def default_cache_dir(path: str) -> str:
+    return os.path.join(os.path.dirname(os.path.abspath(path)), CACHE_DIR_NAME)
+
+
+def _entry_dir(cache_dir: str, path: str, key: str) -> str:
+    stem = os.path.splitext(os.path.basename(path))[0]
+    return os.path.join(cache_dir, f"{stem}-{key}")
+
+
+def _entry_source(entry: str):
+    try:
+        with open(os.path.join(entry, "meta.json")) as f:
+            return json.load(f)["source"]
+    except (OSError, ValueError, KeyError):
+        return None
+
+
+# Remove entries left behind by older versions of the same source file
+# Only entries named exactly <stem>-<key> whose meta.json names this source: the stem of another
+# file may start with this one (climdiv-tmpccy, climdiv-tmpccy-v1.0.0-...), and files with the
+# same name in other directories may share cache_dir
+def _drop_stale_entries(cache_dir: str, path: str, keep: str):
+    stem = os.path.splitext(os.path.basename(path))[0]
+    source = os.path.abspath(path)
+    for name in os.listdir(cache_dir):
+        if not name.startswith(stem + "-") or len(name) != len(stem) + 1 + KEY_CHARS:
+            continue
+        entry = os.path.join(cache_dir, name)
+        if entry != keep and os.path.isdir(entry) and _entry_source(entry) == source:
+            shutil.rmtree(entry, ignore_errors=True)
+
+
+def _write_entry(entry: str, arrays: dict, path: str):
+    parent = os.path.dirname(entry)
+    os.makedirs(parent, exist_ok=True)
+
+    # Write into a scratch directory first so a crashed run never leaves a half-written entry
+    tmp = tempfile.mkdtemp(dir=parent, prefix=".tmp-")
+    try:
+        for col, dtype in CACHE_COLUMNS.items():
+            np.save(os.path.join(tmp, col + ".npy"), np.ascontiguousarray(arrays[col], dtype=dtype))
+        with open(os.path.join(tmp, "meta.json"), "w") as f:
+            json.dump({"source": os.path.abspath(path), "rows": int(len(arrays["year"])),
+                       "version": CACHE_VERSION}, f)
+        os.replace(tmp, entry)
+    except OSError:
+        shutil.rmtree(tmp, ignore_errors=True)
+        # Another process may have written the same entry in the meantime
+        if not os.path.isdir(entry):
+            raise
+
+
+def _read_entry(entry: str, mmap: bool) -> dict:
+    mode = "r" if mmap else None
+    return {col: np.load(os.path.join(entry, col + ".npy"), mmap_mode=mode) for col in CACHE_COLUMNS}
+
+
+# Returns dict of arrays for a climdiv file: state, fips, element, year (integer codes),
+# values (rows x months float32 matrix) and months (value column names),
+# parsing the text only on a cache miss
+# states, years and months select a slice of the cached table, only that slice is copied out
+# of the memory-mapped arrays
+def load_climdiv(path: str, cache_dir: str = None, mmap: bool = True, refresh: bool = False,
+                 states=None, years=None, months=None) -> dict:
+    if cache_dir is None:
+        cache_dir = default_cache_dir(path)
+
+    entry = _entry_dir(cache_dir, path, source_key(path))
+    if refresh or not os.path.isfile(os.path.join(entry, "meta.json")):
+        if refresh:
+            shutil.rmtree(entry, ignore_errors=True)
+        _write_entry(entry, parse_climdiv(path), path)
+        _drop_stale_entries(cache_dir, path, keep=entry)
+
+    data = _read_entry(entry, mmap)
+    data["months"] = list(MONTHS)
+    if states is None and years is None and months is None:
+        return data
+
+    rows = np.flatnonzero(row_mask(data["state"], data["year"], states, years))
+    cols = month_indices(months)
+    out = {col: np.asarray(data[col][rows]) for col in ("state", "fips", "element", "year")}
+    out["values"] = np.asarray(data["values"][rows][:, cols])
+    out["months"] = [MONTHS[i] for i in cols]
+
+    return out
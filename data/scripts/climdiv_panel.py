@@ -0,0 +1,201 @@
+import json
+import os
+import shutil
+import tempfile
+from typing import NamedTuple
+
+import numpy as np
+
+from climdiv import MONTHS, month_indices
+from climdiv_cache import load_climdiv
+
+
+# County x year x month panel of the climdiv county files, for every state and the whole history
+# Each element (tmax, cdd, ...) is one float32 .npy cube of shape (counties, years, months), sharing
+# one county index and one contiguous year range. Counties are sorted by their climdiv id
+# (state code * 1000 + county FIPS), so a state is a contiguous block and a year range is a slice:
+# selecting a state, years or months returns views of the memory-mapped cubes without copying.
+# The cubes are filled from the memory-mapped climdiv cache (climdiv_cache.py) CHUNK_ROWS records
+# at a time into memory-mapped output files, so building the full history needs memory for a
+# chunk only, not for the panel.
+# Missing values (and counties or years a file does not cover) are NaN.
+
+PANEL_VERSION = 1
+CHUNK_ROWS = 1 << 16
+
+# climdiv ids are state code * 1000 + county FIPS, e.g. 4037 for Los Angeles
+COUNTY_ID_BASE = 1000
+
+
+class Panel(NamedTuple):
+    # (counties,) climdiv ids, sorted
+    counties: np.ndarray
+    # (years,) consecutive years
+    years: np.ndarray
+    # {element name: (counties, years, 12) float32 cube}
+    values: dict
+    # (counties,) postal state * 1000 + county FIPS, -1 when county-to-climdivs.txt has no entry
+    postal: np.ndarray
+    # (counties,) climate division as state code * 100 + division, -1 when unknown
+    divisions: np.ndarray
+    months: list = MONTHS
+
+
+# NCDC county id -> (postal FIPS, climate division) from county-to-climdivs.txt
+def read_county_divisions(path: str) -> dict:
+    out = {}
+    with open(path) as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) == 3 and all(part.isdigit() for part in parts):
+                out[int(parts[1])] = (int(parts[0]), int(parts[2]))
+    return out
+
+
+def _write_array(directory: str, name: str, array: np.ndarray):
+    np.save(os.path.join(directory, name + ".npy"), np.ascontiguousarray(array))
+
+
+# Build the panel of sources ({element name: climdiv county file}) into out_dir
+# divisions_file is county-to-climdivs.txt, for the postal FIPS and climate division of each county
+def build_panel(sources: dict, out_dir: str, divisions_file: str = None, chunk_rows: int = CHUNK_ROWS) -> Panel:
+    data = {name: load_climdiv(path) for name, path in sources.items()}
+
+    # Shared county index and year range, one pass over the id columns of each file
+    ids, first, last = [], None, None
+    for d in data.values():
+        for start in range(0, len(d["year"]), chunk_rows):
+            stop = start + chunk_rows
+            ids.append(np.unique(d["state"][start:stop].astype(np.int64) * COUNTY_ID_BASE + d["fips"][start:stop]))
+        if len(d["year"]):
+            lo, hi = int(np.min(d["year"])), int(np.max(d["year"]))
+            first = lo if first is None else min(first, lo)
+            last = hi if last is None else max(last, hi)
+    if first is None:
+        raise ValueError("no records in the panel sources")
+    counties = np.unique(np.concatenate(ids))
+    years = np.arange(first, last + 1, dtype=np.int64)
+
+    postal = np.full(len(counties), -1, dtype=np.int64)
+    divisions = np.full(len(counties), -1, dtype=np.int64)
+    if divisions_file is not None:
+        known = read_county_divisions(divisions_file)
+        for i, county in enumerate(counties):
+            postal[i], divisions[i] = known.get(int(county), (-1, -1))
+
+    parent = os.path.dirname(os.path.abspath(out_dir))
+    os.makedirs(parent, exist_ok=True)
+    # Written into a scratch directory first so a crashed build never leaves a half-written panel
+    tmp = tempfile.mkdtemp(dir=parent, prefix=".tmp-")
+    try:
+        for name, d in data.items():
+            cube = np.lib.format.open_memmap(os.path.join(tmp, f"values_{name}.npy"), mode="w+",
+                                             dtype=np.float32, shape=(len(counties), len(years), len(MONTHS)))
+            cube[:] = np.nan
+            for start in range(0, len(d["year"]), chunk_rows):
+                stop = start + chunk_rows
+                rows = np.searchsorted(counties, d["state"][start:stop].astype(np.int64) * COUNTY_ID_BASE
+                                       + d["fips"][start:stop])
+                cols = d["year"][start:stop].astype(np.int64) - first
+                cube[rows, cols] = d["values"][start:stop]
+            cube.flush()
+            del cube
+
+        _write_array(tmp, "counties", counties)
+        _write_array(tmp, "years", years)
+        _write_array(tmp, "postal", postal)
+        _write_array(tmp, "divisions", divisions)
+        with open(os.path.join(tmp, "meta.json"), "w") as f:
+            json.dump({"version": PANEL_VERSION, "elements": list(sources),
+                       "sources": {name: os.path.abspath(path) for name, path in sources.items()}}, f, indent=1)
+
+        if os.path.isdir(out_dir):
+            shutil.rmtree(out_dir)
+        os.replace(tmp, out_dir)
+    except BaseException:
+        shutil.rmtree(tmp, ignore_errors=True)
+        raise
+
+    return load_panel(out_dir)
+
+
+# Files build_panel writes for these elements, for listing them as stage outputs
+def panel_files(out_dir: str, elements) -> list:
+    names = ["counties", "years", "postal", "divisions"] + [f"values_{name}" for name in elements]
+    return [os.path.join(out_dir, name + ".npy") for name in names] + [os.path.join(out_dir, "meta.json")]
+
+
+def load_panel(out_dir: str, mmap: bool = True) -> Panel:
+    with open(os.path.join(out_dir, "meta.json")) as f:
+        meta = json.load(f)
+    mode = "r" if mmap else None
+
+    def load(name):
+        return np.load(os.path.join(out_dir, name + ".npy"), mmap_mode=mode)
+
+    return Panel(counties=load("counties"), years=load("years"),
+                 values={name: load(f"values_{name}") for name in meta["elements"]},
+                 postal=load("postal"), divisions=load("divisions"))
+
+
+# Row range of each state in the sorted county index
+def _state_slice(panel: Panel, state: int) -> slice:
+    lo, hi = np.searchsorted(panel.counties, [state * COUNTY_ID_BASE, (state + 1) * COUNTY_ID_BASE])
+    return slice(int(lo), int(hi))
+
+
+# Sub-panel for one element: (values, counties, years, months)
+# states is one state code or a list of them, years an inclusive (first, last) range, months names
+# or 1-based numbers. One state and a year range give a view of the cube, no data is copied.
+def select(panel: Panel, element: str, states=None, years=None, months=None):
+    cube = panel.values[element]
+    counties = np.asarray(panel.counties)
+
+    if states is None:
+        rows = slice(None)
+    elif np.ndim(states) == 0:
+        rows = _state_slice(panel, int(states))
+    else:
+        rows = np.concatenate([np.arange(len(counties))[_state_slice(panel, int(s))] for s in states])
+
+    if years is None:
+        cols = slice(None)
+    else:
+        first = int(panel.years[0])
+        cols = slice(max(int(years[0]) - first, 0), max(int(years[1]) - first + 1, 0))
+
+    month_cols = month_indices(months)
+    values = cube[rows, cols]
+    if months is not None:
+        values = values[..., month_cols]
+    return values, counties[rows], np.asarray(panel.years[cols]), [MONTHS[i] for i in month_cols]
+
+
+# (counties, 12) normals of the panel counties from a climdiv normals file, NaN where it has none
+# period is the normals period code (normals-readme.txt), 10 = 1991-2020
+def read_normals(path: str, counties: np.ndarray, period: int = 10) -> np.ndarray:
+    data = load_climdiv(path)
+    keep = np.flatnonzero(np.asarray(data["year"]) == period)
+    ids = data["state"][keep].astype(np.int64) * COUNTY_ID_BASE + data["fips"][keep]
+
+    out = np.full((len(counties), len(MONTHS)), np.nan, dtype=np.float32)
+    pos = np.searchsorted(counties, ids)
+    pos = np.minimum(pos, len(counties) - 1)
+    found = counties[pos] == ids
+    out[pos[found]] = data["values"][keep[found]]
+    return out
+
+
+# Departure of a selection from the normals: values (counties, years, months) minus normals (counties, 12)
+# months must be the month names of values, as returned by select
+def anomalies(values: np.ndarray, normals: np.ndarray, months=MONTHS) -> np.ndarray:
+    return np.asarray(values, dtype=np.float32) - normals[:, None, month_indices(months)]
+
+
+# Departures of a slice of the panel in panel_dir from the normals in normals_file,
+# (values, counties, years, months) like select
+def panel_anomalies(panel_dir: str, normals_file: str, element: str, states=None, years=None, months=None,
+                    period: int = 10):
+    values, counties, years, months = select(load_panel(panel_dir), element, states, years, months)
+    normals = read_normals(normals_file, counties, period)
+    return anomalies(values, normals, months), counties, years, months
@@ -0,0 +1,163 @@
+from typing import NamedTuple
+
+import numpy as np
+import pandas as pd
+
+
+# Declarative county table builder
+# Each Indicator says where a value comes from and what to call it. build_county_table loads every
+# source once, aligns all indicators onto one fixed county index and builds the wide table with a
+# single DataFrame construction, instead of a chain of merges that copies the table per indicator.
+# Every indicator declares a unit, and its value column is converted to float64 when the source is
+# read, so the numeric part of the county table is one contiguous float64 block. The table has one
+# row per county: float32 would save nothing measurable and add rounding noise to the fits downstream
+# (float32 is for the large climdiv arrays).
+
+# Units of the Tracking Network value columns
+# percent: "74.35%" -> 74.35, count: "429,425" -> 429425, rate: plain numbers such as "20.62"
+# Anything that is not a number after that (e.g. "No Counts") becomes NaN
+PERCENT = "percent"
+COUNT = "count"
+RATE = "rate"
+
+# Characters stripped from the raw strings before parsing, per unit
+UNIT_STRIP = {
+    PERCENT: r"%",
+    COUNT: r",",
+    RATE: None,
+}
+
+
+class Indicator(NamedTuple):
+    # Path to a Tracking Network csv / Tracking California xlsx, or an already loaded DataFrame
+    source: object
+    # Column holding the value in the source
+    column: str
+    # Column name in the county table
+    name: str
+    # "latest" keeps the most recent year, an int keeps that year, None means the source has no years
+    year: object = "latest"
+    # Column holding the county name in the source
+    key: str = "County"
+    # One of PERCENT, COUNT, RATE, or None to keep the column as it is in the source
+    unit: str = RATE
+
+
+# Convert the columns in schema ({column: unit}) to float64
+# Columns sharing a unit are cleaned together with one vectorized replace over the block
+def normalize_columns(df: pd.DataFrame, schema: dict) -> pd.DataFrame:
+    if not schema:
+        return df
+
+    df = df.copy()
+    for unit in set(schema.values()):
+        cols = [col for col, u in schema.items() if u == unit]
+        block = df[cols]
+        if UNIT_STRIP[unit] is not None:
+            block = block.astype(str).replace(UNIT_STRIP[unit], "", regex=True)
+        block = block.apply(pd.to_numeric, errors="coerce")
+        df[cols] = block.astype(np.float64)
+
+    return df
+
+
+# Read a Tracking Network csv, End Year becomes Year for multi-year indicators
+# schema ({column: unit}) declares the value columns to normalize
+def cleanup_csv(file: str, schema: dict = None) -> pd.DataFrame:
+    df = pd.read_csv(file)
+    df = df.rename(columns={"End Year": "Year"})
+
+    return normalize_columns(df, schema)
+
+
+# Slightly different work for the Excel sheets
+# The statewide "California" row is not a county, aligning on the county index drops it
+def cleanup_xlsx(file: str, schema: dict = None) -> pd.DataFrame:
+    df = pd.read_excel(file)
+    df = df.rename(columns={"Counties": "County"})
+
+    return normalize_columns(df, schema)
+
+
+def read_source(source, schema: dict = None) -> pd.DataFrame:
+    if isinstance(source, pd.DataFrame):
+        return normalize_columns(source, schema)
+    if str(source).endswith((".xlsx", ".xls")):
+        return cleanup_xlsx(source, schema)
+    return cleanup_csv(source, schema)
+
+
+# {source id: {column: unit}} for every indicator with a declared unit
+def source_schemas(indicators: list) -> dict:
+    schemas = {}
+    for ind in indicators:
+        schema = schemas.setdefault(_source_id(ind.source), {})
+        if ind.unit is not None:
+            if schema.get(ind.column, ind.unit) != ind.unit:
+                raise ValueError(f"{ind.column!r} of {ind.source} declared as both {schema[ind.column]} and {ind.unit}")
+            schema[ind.column] = ind.unit
+    return schemas
+
+
+# Keep only the requested year if there are multiple
+def select_year(df: pd.DataFrame, year) -> pd.DataFrame:
+    if year is None:
+        return df
+    if year == "latest":
+        return df[df["Year"] == df["Year"].max()]
+    return df[df["Year"] == year]
+
+
+def _source_id(source):
+    return id(source) if isinstance(source, pd.DataFrame) else str(source)
+
+
+# Load every distinct source once, keyed by path (or object identity for DataFrames)
+# Sources already in frames (e.g. read concurrently by ingest.read_sources with the schemas from
+# source_schemas) are not read again
+def load_sources(indicators: list, frames: dict = None) -> dict:
+    frames = dict(frames or {})
+    schemas = source_schemas(indicators)
+    for ind in indicators:
+        sid = _source_id(ind.source)
+        if sid not in frames:
+            frames[sid] = read_source(ind.source, schemas[sid])
+
+    return frames
+
+
+# Paths of the file-based sources, each listed once
+def source_files(indicators: list) -> list:
+    return list(dict.fromkeys(str(ind.source) for ind in indicators if not isinstance(ind.source, pd.DataFrame)))
+
+
+# Values of one indicator in county index order, NaN for counties missing from the source
+def align_indicator(frame: pd.DataFrame, ind: Indicator, index: pd.Index):
+    df = select_year(frame, ind.year)
+    keys = df[ind.key].astype(str).str.strip()
+    values = pd.Series(df[ind.column].to_numpy(), index=keys)
+    values = values[~values.index.duplicated(keep="first")]
+
+    return values.reindex(index).to_numpy()
+
+
+# Build the wide county table, one row per county in counties, one column per indicator
+# Indicators with a unit are written into a single preallocated float64 block
+def build_county_table(indicators: list, counties: list, frames: dict = None) -> pd.DataFrame:
+    frames = load_sources(indicators, frames)
+
+    index = pd.Index(counties, name="County")
+    numeric = [ind for ind in indicators if ind.unit is not None]
+    block = np.empty((len(index), len(numeric)), dtype=np.float64)
+    for j, ind in enumerate(numeric):
+        block[:, j] = align_indicator(frames[_source_id(ind.source)], ind, index)
+
+    table = pd.DataFrame(block, columns=[ind.name for ind in numeric])
+    table.insert(0, "County", index.to_numpy())
+    if len(numeric) == len(indicators):
+        return table
+
+    for ind in indicators:
+        if ind.unit is None:
+            table[ind.name] = align_indicator(frames[_source_id(ind.source)], ind, index)
+    return table[["County"] + [ind.name for ind in indicators]]
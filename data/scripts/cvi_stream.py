@@ -0,0 +1,116 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+
+# Streaming read of the national Master CVI workbook
+# openpyxl's read-only mode walks the sheet row by row without building the whole workbook in memory.
+# Rows of other states are dropped as they are read, and the kept rows are handed on in chunks, so
+# memory depends on the chunk size and not on the size of the national sheet.
+# The food access values are joined on the census tract through an int64 index built once from the
+# csv, and each chunk is appended to the Parquet output as soon as it is complete.
+
+CHUNK_ROWS = 4096
+
+STATE_COLUMN = "State"
+TRACT_COLUMN = "FIPS Code"
+FOOD_ACCESS_COLUMN = "Food Access"
+# Text columns of the sheet, every other column except the tract is a score
+TEXT_COLUMNS = {STATE_COLUMN, "County", FOOD_ACCESS_COLUMN}
+
+
+# Yields (header, rows) with lists of up to chunk_rows row tuples whose state is state
+def iter_state_rows(path: str, state: str = "CA", sheet: str = None, chunk_rows: int = CHUNK_ROWS):
+    from openpyxl import load_workbook
+
+    wb = load_workbook(path, read_only=True, data_only=True)
+    try:
+        ws = wb[sheet] if sheet is not None else wb.active
+        rows = ws.iter_rows(values_only=True)
+        header = [str(name) for name in next(rows)]
+        col = header.index(STATE_COLUMN)
+
+        chunk = []
+        for row in rows:
+            if row[col] == state:
+                chunk.append(row)
+                if len(chunk) == chunk_rows:
+                    yield header, chunk
+                    chunk = []
+        if chunk:
+            yield header, chunk
+    finally:
+        wb.close()
+
+
+# int64 tract index and the food access values for one year, the index looks tracts up by hash
+# A tract listed twice keeps its first row
+def food_access_index(path: str, year: int = 2019):
+    df = pd.read_csv(path, usecols=["CensusTract", "Year", FOOD_ACCESS_COLUMN],
+                     dtype={"CensusTract": np.int64, "Year": np.int64})
+    df = df[df.Year == year].drop_duplicates("CensusTract")
+    return pd.Index(df["CensusTract"].to_numpy(np.int64)), df[FOOD_ACCESS_COLUMN].to_numpy(object)
+
+
+# Food access value of each tract, None where the csv has no row for it
+def lookup_food_access(tracts: np.ndarray, index: pd.Index, values: np.ndarray) -> np.ndarray:
+    pos = index.get_indexer(tracts)
+    out = np.full(len(tracts), None, dtype=object)
+    out[pos >= 0] = values[pos[pos >= 0]]
+    return out
+
+
+def _arrow_schema(columns: list):
+    import pyarrow as pa
+
+    return pa.schema([(name, pa.string() if name in TEXT_COLUMNS else pa.int64() if name == TRACT_COLUMN
+                       else pa.float64()) for name in columns])
+
+
+# One chunk of sheet rows as a DataFrame with the food access column attached
+def _chunk_frame(header: list, rows: list, index: pd.Index, values: np.ndarray) -> pd.DataFrame:
+    df = pd.DataFrame.from_records(rows, columns=header)
+    df = df.drop(columns=[STATE_COLUMN])
+    for name in df.columns:
+        if name == TRACT_COLUMN:
+            df[name] = pd.to_numeric(df[name]).astype(np.int64)
+        elif name not in TEXT_COLUMNS:
+            df[name] = pd.to_numeric(df[name], errors="coerce").astype(np.float64)
+    df[FOOD_ACCESS_COLUMN] = lookup_food_access(df[TRACT_COLUMN].to_numpy(), index, values)
+    return df
+
+
+# Filter the CVI sheet to state, attach food access and write the result to out_path (Parquet)
+# Returns the number of rows written
+def stream_cvi(cvi_path: str, food_access_path: str, out_path: str, state: str = "CA", year: int = 2019,
+               chunk_rows: int = CHUNK_ROWS) -> int:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    index, values = food_access_index(food_access_path, year)
+
+    # Written under a scratch name first so a failed run never leaves a truncated table behind
+    tmp = out_path + ".tmp"
+    writer = None
+    n = 0
+    try:
+        for header, rows in iter_state_rows(cvi_path, state, chunk_rows=chunk_rows):
+            df = _chunk_frame(header, rows, index, values)
+            if writer is None:
+                schema = _arrow_schema(list(df.columns))
+                writer = pq.ParquetWriter(tmp, schema)
+            writer.write_table(pa.Table.from_pandas(df, schema=schema, preserve_index=False))
+            n += len(df)
+        if writer is None:
+            raise ValueError(f"no rows with {STATE_COLUMN} == {state!r} in {cvi_path}")
+        writer.close()
+        os.replace(tmp, out_path)
+    except BaseException:
+        if writer is not None:
+            writer.close()
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+
+    return n
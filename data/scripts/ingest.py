@@ -0,0 +1,67 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import NamedTuple
+
+
+# Concurrent reading of independent raw sources
+# CPU-bound readers (Excel via openpyxl, climdiv fixed-width parsing) hold the GIL, so they go to a
+# process pool. Plain csv reads are mostly I/O and go to a thread pool in the parent process.
+# Reader functions must be importable module-level functions so the process pool can pickle them.
+
+
+class Source(NamedTuple):
+    fn: object
+    args: tuple = ()
+    kwargs: dict = None
+    # True sends the read to the process pool, False to the thread pool
+    cpu: bool = False
+
+
+# Default worker count, can be overridden with the INGEST_WORKERS environment variable
+def default_workers() -> int:
+    return int(os.environ.get("INGEST_WORKERS", os.cpu_count() or 1))
+
+
+def _timed(fn, args, kwargs):
+    start = time.perf_counter()
+    result = fn(*args, **(kwargs or {}))
+    return result, time.perf_counter() - start
+
+
+# Source names are usually paths, only the file name is printed
+def print_timings(timings: dict, wall: float):
+    labels = {name: os.path.basename(str(name)) or str(name) for name in timings}
+    width = max([len(label) for label in labels.values()] + [len("wall clock")])
+    for name, secs in sorted(timings.items(), key=lambda item: -item[1]):
+        print(f"  {labels[name]:<{width}}  {secs * 1000:9.1f} ms")
+    print(f"  {'wall clock':<{width}}  {wall * 1000:9.1f} ms (sum {sum(timings.values()) * 1000:.1f} ms)")
+
+
+# Read every source, returns {name: result}
+# workers bounds each pool, workers=1 reads everything sequentially in this process
+# With verbose=True prints per-source timings, slowest first
+def read_sources(sources: dict, workers: int = None, verbose: bool = True) -> dict:
+    if workers is None:
+        workers = default_workers()
+
+    start = time.perf_counter()
+    results, timings = {}, {}
+    if workers <= 1:
+        for name, src in sources.items():
+            results[name], timings[name] = _timed(src.fn, src.args, src.kwargs)
+    else:
+        n_cpu = sum(1 for src in sources.values() if src.cpu)
+        n_io = len(sources) - n_cpu
+        with ProcessPoolExecutor(max(1, min(workers, n_cpu))) as procs, \
+                ThreadPoolExecutor(max(1, min(workers, n_io))) as threads:
+            futures = {name: (procs if src.cpu else threads).submit(_timed, src.fn, src.args, src.kwargs)
+                       for name, src in sources.items()}
+            for name, future in futures.items():
+                results[name], timings[name] = future.result()
+
+    if verbose:
+        print(f"Read {len(sources)} sources with {workers} worker(s):")
+        print_timings(timings, time.perf_counter() - start)
+
+    return results
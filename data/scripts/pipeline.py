@@ -0,0 +1,143 @@
+import hashlib
+import json
+import os
+import time
+from typing import NamedTuple
+
+
+# Incremental stage runner
+# Every stage lists the files it reads and writes. A manifest records the content hash of each
+# of them after a stage runs, and on the next run a stage is re-executed only if an input hash
+# changed, an output is missing or was modified, or the stage itself is new.
+# Stages run in list order, so a stage must come after the stages producing its inputs. Rebuilt
+# outputs get new hashes, which is what makes downstream stages stale.
+# The code of a stage is hashed too: the source of its function and whatever it lists in code, so
+# editing one stage's code reruns that stage only, not every stage defined in the same script.
+
+
+class Stage(NamedTuple):
+    name: str
+    # Called with no arguments, must write every path in outputs
+    fn: object
+    inputs: list
+    outputs: list
+    # Module files (paths) and functions the stage runs besides fn
+    code: tuple = ()
+
+
+HASH_BLOCK = 1 << 20
+
+
+def file_hash(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(HASH_BLOCK), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+# Content hash of path, reusing the manifest's hash when size and mtime are unchanged
+# so large workbooks are not re-read just to find out nothing changed
+def fingerprint(path: str, known: dict) -> dict:
+    st = os.stat(path)
+    old = known.get(os.path.abspath(path))
+    if old and old["size"] == st.st_size and old["mtime_ns"] == st.st_mtime_ns:
+        return old
+    return {"size": st.st_size, "mtime_ns": st.st_mtime_ns, "sha256": file_hash(path)}
+
+
+# Hash of the source of the stage function (unwrapping functools.partial) and of stage.code
+def code_hash(stage: Stage) -> str:
+    import inspect
+
+    fn = stage.fn
+    while hasattr(fn, "func"):
+        fn = fn.func
+    h = hashlib.sha256()
+    for item in (fn, *stage.code):
+        h.update((file_hash(item) if isinstance(item, str) else inspect.getsource(item)).encode())
+    return h.hexdigest()
+
+
+def load_manifest(path: str) -> dict:
+    if not os.path.isfile(path):
+        return {"files": {}, "stages": {}}
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_manifest(manifest: dict, path: str):
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    os.replace(tmp, path)
+
+
+def _hashes(paths: list, manifest: dict) -> dict:
+    out = {}
+    for p in paths:
+        key = os.path.abspath(p)
+        manifest["files"][key] = fingerprint(p, manifest["files"])
+        out[key] = manifest["files"][key]["sha256"]
+    return out
+
+
+# Returns the reason a stage has to run, or None if it is up to date
+def stale_reason(stage: Stage, manifest: dict):
+    recorded = manifest["stages"].get(stage.name)
+    if recorded is None:
+        return "never built"
+    if sorted(recorded["inputs"]) != sorted(os.path.abspath(p) for p in stage.inputs):
+        return "input list changed"
+    if recorded.get("code") != code_hash(stage):
+        return "code changed"
+
+    for p in stage.outputs:
+        if not os.path.isfile(p):
+            return f"missing {os.path.basename(p)}"
+    for key, digest in _hashes(stage.inputs, manifest).items():
+        if recorded["inputs"][key] != digest:
+            return f"{os.path.basename(key)} changed"
+    for key, digest in _hashes(stage.outputs, manifest).items():
+        if recorded["outputs"].get(key) != digest:
+            return f"{os.path.basename(key)} modified"
+
+    return None
+
+
+# Run the stages that are out of date, returns the names of the stages that ran
+# force=True rebuilds everything, only=[names] restricts the run to those stages
+def run_stages(stages: list, manifest_path: str, force: bool = False, only: list = None,
+               verbose: bool = True) -> list:
+    manifest = load_manifest(manifest_path)
+    ran = []
+
+    for stage in stages:
+        if only is not None and stage.name not in only:
+            continue
+        missing = [p for p in stage.inputs if not os.path.isfile(p)]
+        if missing:
+            raise FileNotFoundError(f"stage {stage.name!r} is missing inputs: {missing}")
+
+        reason = "forced" if force else stale_reason(stage, manifest)
+        if reason is None:
+            if verbose:
+                print(f"[{stage.name}] up to date")
+            continue
+
+        if verbose:
+            print(f"[{stage.name}] rebuilding ({reason})")
+        start = time.perf_counter()
+        stage.fn()
+        manifest["stages"][stage.name] = {
+            "inputs": _hashes(stage.inputs, manifest),
+            "outputs": _hashes(stage.outputs, manifest),
+            "code": code_hash(stage),
+            "seconds": round(time.perf_counter() - start, 3),
+        }
+        save_manifest(manifest, manifest_path)
+        ran.append(stage.name)
+        if verbose:
+            print(f"[{stage.name}] done in {manifest['stages'][stage.name]['seconds']:.2f} s")
+
+    return ran
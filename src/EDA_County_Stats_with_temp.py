@@ -1,23 +1,86 @@
-import pandas as pd
-import matplotlib.pyplot as plt
+import os
+
 import numpy as np
-import seaborn as sns
 
-from scipy.optimize import least_squares
-from sklearn.model_selection import train_test_split
+from src.artifacts import COUNTY_STATS_FILE, COUNTY_STATS_SNAPSHOT, CVI_COUNTY_FILE, FEATURES
+from src.plotting import features_tag, flush, pairplot_selection, render
+from src.result_cache import cached_call
+
+
+# Importing this module only defines the analysis, nothing is read, fitted or plotted.
+# run_eda() does the full EDA (python __main__.py eda). pandas and the plotting and model fitting
+# libraries (matplotlib, seaborn, scipy, sklearn) are imported inside the functions that use them.
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TRAIN_FILE = os.path.join(REPO_DIR, 'src', 'train_post_EDA.csv')
+VALIDATE_FILE = os.path.join(REPO_DIR, 'src', 'validate_post_EDA.csv')
+
+# column names
+july_col = "July max temp (F)"
+august_col = "August max temp (F)"
+y_col = "Emergency Visits / 100000"
+resid_col = y_col + " temp residual"
+
+# breakpoint of the heat fit, below it there is no unusual risk (see the notes above the fit)
+# the slope and intercept are fitted from the data at this threshold by heat_parameters,
+# src/threshold_sweep.py shows how sensitive they are to it
+X_THRESH = 80.0
+
+# We are going to use 4 features, FEATURES (src/artifacts.py, shared with the regressions)
+
 
+# County table built by data/scripts/cleanup_with_temperature.py (src/artifacts.py has the paths)
+# Parquet keeps the column types (all indicators are float64) and loads much faster than the Excel report copy
+# Before the first build the committed snapshot is read. It keeps the source formatting ("18.7%",
+# "No Counts"), which is parsed to float64 numbers like the built table (NaN for the markers).
+def load_county_stats(path=COUNTY_STATS_FILE):
+    import pandas as pd
 
-df = pd.read_excel('County_Statistics_with_Temp.xlsx')
-df_Emergency = df.dropna(subset=['Emergency Visits / 100000'])
-df_Emergency = df_Emergency.drop('Hospitalizations / 100000', axis=1)
+    if os.path.exists(path):
+        return pd.read_parquet(path)
+    for report in (os.path.splitext(path)[0] + '.xlsx', COUNTY_STATS_SNAPSHOT if path == COUNTY_STATS_FILE else None):
+        if report is not None and os.path.exists(report):
+            df = pd.read_excel(report)
+            values = df.columns.drop('County')
+            df[values] = df[values].apply(
+                lambda col: pd.to_numeric(col.astype(str).str.replace(r'[%,]', '', regex=True), errors='coerce'))
+            return df.astype({col: np.float64 for col in values})
+    raise FileNotFoundError(f"{path} does not exist, build it with: python __main__.py build")
 
 
-def histogram(feature, color):
-    sns.histplot(df[feature], bins=15, kde=True, color=color)
+# One row per county, County plus the tract count and the aggregated CVI / food access columns
+# Written by the cvi_counties stage of the build, from the tract table of the cvi stage or, without the
+# Master CVI workbook, the committed California_CVI_dataset.xlsx
+def load_cvi_features(path=CVI_COUNTY_FILE):
+    import pandas as pd
+
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"{path} does not exist, build it with: python __main__.py build --stage cvi_counties")
+    return pd.read_parquet(path)
+
+
+# Counties with an emergency visit rate, hospitalizations dropped
+def emergency_frame(df):
+    df_Emergency = df.dropna(subset=[y_col])
+    df_Emergency = df_Emergency.drop('Hospitalizations / 100000', axis=1)
+    return df_Emergency
+
+
+# Figures are drawn by the draw_* functions and shown or saved through src/plotting.py
+def draw_histogram(values, feature, color):
+    import matplotlib.pyplot as plt
+    import seaborn as sns
+
+    plt.figure()
+    sns.histplot(values, bins=15, kde=True, color=color)
     plt.title(f'Distribution of {feature} (All Counties)')
     plt.xlabel(feature)
     plt.ylabel('Number of Counties')
-    plt.show()
+    return plt.gcf()
+
+
+def histogram(df, feature, color):
+    render(draw_histogram, f'histogram {feature}', values=df[feature], feature=feature, color=color)
 
 
 # Notes: A few counties have high ER visit and that corresponds to high heat counties like Imperial County
@@ -29,22 +92,83 @@ def histogram(feature, color):
 # Both of these suggest to set the threshold to 80 F
 
 
+# With b tied to m through y(x_thresh) = y_min the model is y - y_min = m * (x - x_thresh), a least
+# squares problem in one parameter with the exact solution m = sum(dx * dy) / sum(dx ** 2). The squared
+# error is a parabola in m, so clipping that slope to [lower, upper] is also the exact bounded solution.
+# anchored_slopes solves a whole stack of such fits at once: every row of x is one candidate series
+# (a month, a threshold, a subset of counties with the others set to NaN) against the same y.
+def anchored_slopes(x, y, x_thresh=80.0, y_min=None, lower=-np.inf, upper=np.inf):
+    """
+    Fit y = m * x + b with y(x_thresh) = y_min to every row of x, using the points with x >= x_thresh.
+
+    Args:
+        x: (k, n) array, one candidate x-series per row (a 1-D array is one row). NaNs are skipped.
+        y: (n,) array shared by all rows, or (k, n).
+        x_thresh: scalar or (k,) thresholds.
+        y_min: scalar or (k,) anchor values. If None, uses np.nanmin(y).
+        lower, upper: bounds for m, scalars or (k,).
+
+    Returns:
+        dict of (k,) arrays m, b, rmse, r2, n (points used) and the (k, n) x_fit_mask.
+        Rows without any point at or above the threshold get NaN.
+    """
+    x_arr = np.atleast_2d(np.asarray(x, dtype=float))
+    y_arr = np.broadcast_to(np.asarray(y, dtype=float), x_arr.shape)
+    k = x_arr.shape[0]
+
+    if y_min is None:
+        y_min = np.nanmin(y_arr)
+    x_thresh = np.broadcast_to(np.asarray(x_thresh, dtype=float), (k,))
+    y_min = np.broadcast_to(np.asarray(y_min, dtype=float), (k,))
+
+    # NaN compares False, so NaN x drop out of the threshold test
+    mask = (x_arr >= x_thresh[:, None]) & ~np.isnan(y_arr)
+    n = mask.sum(axis=1)
+
+    dx = np.where(mask, x_arr - x_thresh[:, None], 0.0)
+    dy = np.where(mask, y_arr - y_min[:, None], 0.0)
+    sxx = (dx * dx).sum(axis=1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        m = np.clip((dx * dy).sum(axis=1) / sxx, lower, upper)
+    # every selected x sits on the threshold, any slope fits equally well
+    m = np.where((sxx == 0) & (n > 0), np.clip(0.0, lower, upper), m)
+    b = y_min - m * x_thresh
+
+    resid = np.where(mask, dy - m[:, None] * dx, 0.0)
+    rss = (resid * resid).sum(axis=1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        y_mean = np.where(mask, y_arr, 0.0).sum(axis=1) / n
+        tss = (np.where(mask, y_arr - y_mean[:, None], 0.0) ** 2).sum(axis=1)
+        rmse = np.sqrt(rss / n)
+        r2 = np.where(tss != 0, 1 - rss / tss, np.nan)
+
+    m = np.where(n > 0, m, np.nan)
+    b = np.where(n > 0, b, np.nan)
+    return {'m': m, 'b': b, 'rmse': rmse, 'r2': r2, 'n': n, 'x_fit_mask': mask}
+
+
 def fit_linear_with_intercept_enforced(x, y, lower, upper,title, x_thresh=80.0, y_min=None,
-                                       plot=True, max_nfev=20000):
+                                       plot=True, max_nfev=20000, model=None):
     """
     Fit y = m * x + b to points with x >= x_thresh, enforcing b so that y(x_thresh) = y_min.
     y_min defaults to the min of the original y array (ignoring NaNs) if not provided.
 
     Args:
         x, y: 1-D array-like (will be converted to numpy arrays). NaNs are handled.
+            x may also be a (k, n) stack of x-series, fitted together by anchored_slopes.
         lower, upper: bounds for parameter vector [m]. Each must be scalar or length-1 sequence.
-        x_thresh: threshold where intercept is enforced (default 80.0).
+        title: plot title, one per row when x is a stack.
+        x_thresh: threshold where intercept is enforced (default 80.0), or one per row.
         y_min: value y(x_thresh) should equal. If None, uses np.nanmin(y) from the original y.
         plot: if True, show a scatter + fitted line plot.
         max_nfev: max evaluations for least_squares.
+        model: None for the linear model, solved in closed form. A non-linear variant is a function
+            model(m, xvals, x_thresh, y_min) returning predictions, fitted with least_squares.
 
     Returns:
-        dict with keys: m, b, success, message, rmse, r2, res (least_squares result), x_fit_mask, x, y, y_pred
+        dict with keys: m, b, success, message, rmse, r2, res (least_squares result, None for the
+        closed form), x_fit_mask, x, y, y_pred. For a stack of x-series every value is a
+        sequence with one entry per row.
     """
     x_arr = np.asarray(x, dtype=float)
     y_arr = np.asarray(y, dtype=float)
@@ -53,69 +177,96 @@ def fit_linear_with_intercept_enforced(x, y, lower, upper,title, x_thresh=80.0,
     if y_min is None:
         y_min = np.nanmin(y_arr)
 
-    # mask for x >= threshold and non-NaN pairs
-    mask = (x_arr >= x_thresh) & ~np.isnan(x_arr) & ~np.isnan(y_arr)
-    x_sel = x_arr[mask]
-    y_sel = y_arr[mask]
+    # ensure bounds are arrays of length 1
+    lower_arr = np.atleast_1d(np.array(lower, dtype=float))
+    upper_arr = np.atleast_1d(np.array(upper, dtype=float))
+    if lower_arr.size != 1 or upper_arr.size != 1:
+        raise ValueError("lower and upper must be scalar or length-1 sequences for parameter [m].")
 
-    if x_sel.size == 0:
-        raise ValueError(f"No data points with x >= {x_thresh}")
+    # the fit is looked up in src/result_cache.py, only the plots are redrawn on a hit
+    out = cached_call(_fit, x_arr, y_arr, lower_arr, upper_arr, x_thresh, y_min, max_nfev, model)
 
-    # model: y = m * x + b with b = y_min - m * x_thresh
-    def model_given_m(params, xvals):
-        m = params[0]
-        b = y_min - m * x_thresh
-        return m * xvals + b
+    # optional plot (shows only selected points and fitted line)
+    if plot and x_arr.ndim == 1:
+        render(draw_linear_fit, 'linear fit ' + title, x_sel=out['x_selected'], y_sel=out['y_selected'],
+               m_fit=out['m'], b_fit=out['b'], x_thresh=x_thresh, y_min=y_min, title=title)
+    elif plot:
+        titles = [title] * len(x_arr) if isinstance(title, str) else list(title)
+        x_thresh = np.broadcast_to(x_thresh, len(x_arr))
+        for i, t in enumerate(titles):
+            render(draw_linear_fit, 'linear fit ' + t, x_sel=out['x_selected'][i], y_sel=out['y_selected'][i],
+                   m_fit=out['m'][i], b_fit=out['b'][i], x_thresh=x_thresh[i], y_min=y_min, title=t)
+    return out
+
+
+def _fit(x_arr, y_arr, lower_arr, upper_arr, x_thresh, y_min, max_nfev, model):
+    if x_arr.ndim == 1:
+        return _fit_one(x_arr, y_arr, lower_arr, upper_arr, x_thresh, y_min, max_nfev, model)
+
+    if model is not None:
+        fits = [_fit_one(x_row, y_arr, lower_arr, upper_arr, xt, y_min, max_nfev, model)
+                for x_row, xt in zip(x_arr, np.broadcast_to(x_thresh, len(x_arr)))]
+        return {key: [fit[key] for fit in fits] for key in fits[0]}
+
+    fit = anchored_slopes(x_arr, y_arr, x_thresh, y_min, lower_arr[0], upper_arr[0])
+    return _closed_form_result(fit, x_arr, np.broadcast_to(y_arr, x_arr.shape))
+
+
+# Per-row results of anchored_slopes in the fit_linear_with_intercept_enforced shape
+def _closed_form_result(fit, x_arr, y_arr):
+    mask = fit['x_fit_mask']
+    x_sel = [row[keep] for row, keep in zip(x_arr, mask)]
+    y_sel = [row[keep] for row, keep in zip(y_arr, mask)]
+    return {
+        'm': fit['m'],
+        'b': fit['b'],
+        'success': fit['n'] > 0,
+        'message': ['closed form' if n else 'no points above the threshold' for n in fit['n']],
+        'rmse': fit['rmse'],
+        'r2': fit['r2'],
+        'res': [None] * len(mask),
+        'x_fit_mask': mask,
+        'x_selected': x_sel,
+        'y_selected': y_sel,
+        'y_pred_selected': [m * xs + b for m, b, xs in zip(fit['m'], fit['b'], x_sel)],
+    }
 
-    def residuals(params, xvals, yvals):
-        return model_given_m(params, xvals) - yvals
 
-    # initial guess for m: slope from simple linear fit on selected points if possible
-    try:
-        slope_init = np.polyfit(x_sel, y_sel, 1)[0]
-        m_init = slope_init
-    except Exception:
-        m_init = (np.nanmean(y_sel) / np.nanmean(x_sel)) if np.nanmean(x_sel) != 0 else 1.0
+# Linear anchored model, the default for the iterative path
+def anchored_line(m, xvals, x_thresh, y_min):
+    return m * xvals + (y_min - m * x_thresh)
 
-    init = np.atleast_1d(np.array([m_init], dtype=float))
 
-    # ensure bounds are arrays of length 1
-    lower_arr = np.atleast_1d(np.array(lower, dtype=float))
-    upper_arr = np.atleast_1d(np.array(upper, dtype=float))
-    if lower_arr.size != 1 or upper_arr.size != 1:
-        raise ValueError("lower and upper must be scalar or length-1 sequences for parameter [m].")
+def _fit_one(x_arr, y_arr, lower_arr, upper_arr, x_thresh, y_min, max_nfev, model):
+    # mask for x >= threshold and non-NaN pairs
+    mask = (x_arr >= x_thresh) & ~np.isnan(x_arr) & ~np.isnan(y_arr)
+    x_sel = x_arr[mask]
+    y_sel = y_arr[mask]
 
-    res = least_squares(residuals, init, args=(x_sel, y_sel), bounds=(lower_arr, upper_arr),
-                        ftol=1e-9, xtol=1e-9, gtol=1e-9, max_nfev=max_nfev)
+    if x_sel.size == 0:
+        raise ValueError(f"No data points with x >= {x_thresh}")
 
-    m_fit = res.x[0]
+    if model is None:
+        fit = anchored_slopes(x_sel, y_sel, x_thresh, y_min, lower_arr[0], upper_arr[0])
+        m_fit = fit['m'][0]
+        res = None
+        success, message = True, 'closed form'
+    else:
+        m_fit, res = _least_squares_slope(x_sel, y_sel, lower_arr, upper_arr, x_thresh, y_min, max_nfev, model)
+        success, message = res.success, res.message
     b_fit = y_min - m_fit * x_thresh
 
     # diagnostics on selected points
-    y_pred_sel = model_given_m([m_fit], x_sel)
+    y_pred_sel = (model or anchored_line)(m_fit, x_sel, x_thresh, y_min)
     rss = np.sum((y_sel - y_pred_sel) ** 2)
     rmse = np.sqrt(rss / len(y_sel))
     r2 = 1 - rss / np.sum((y_sel - np.mean(y_sel)) ** 2) if np.sum((y_sel - np.mean(y_sel)) ** 2) != 0 else np.nan
 
-    # optional plot (shows only selected points and fitted line)
-    if plot:
-        xs = np.linspace(np.nanmin(x_sel) - 1, np.nanmax(x_sel) + 1, 400)
-        ys = m_fit * xs + b_fit
-        plt.figure(figsize=(8,6))
-        plt.scatter(x_sel, y_sel, label='data (x >= {:.1f})'.format(x_thresh), c='C0')
-        plt.plot(xs, ys, 'r-', lw=2, label=f'fit: y = {m_fit:.4g}*x + {b_fit:.4g}')
-        plt.scatter([x_thresh], [y_min], color='black', zorder=5, label=f'y({x_thresh}) enforced = {y_min:.3g}')
-        plt.xlabel(f'x (>= {x_thresh})')
-        plt.ylabel('y')
-        plt.legend()
-        plt.title('Linear fit for '+title)
-        plt.show()
-
     return {
         'm': m_fit,
         'b': b_fit,
-        'success': res.success,
-        'message': res.message,
+        'success': success,
+        'message': message,
         'rmse': rmse,
         'r2': r2,
         'res': res,
@@ -126,9 +277,44 @@ def fit_linear_with_intercept_enforced(x, y, lower, upper,title, x_thresh=80.0,
     }
 
 
-def temperature_plots():
-    x_july = df_Emergency['July max temp (F)']
-    x_august = df_Emergency['August max temp (F)']
+# The original iterative fit, kept for models without a closed form
+def _least_squares_slope(x_sel, y_sel, lower_arr, upper_arr, x_thresh, y_min, max_nfev, model=anchored_line):
+    from scipy.optimize import least_squares
+
+    def residuals(params, xvals, yvals):
+        return model(params[0], xvals, x_thresh, y_min) - yvals
+
+    # initial guess for m: the anchored linear slope, clipped to the bounds and moved strictly inside
+    # them (started on a bound, least_squares can stop right there and still report success)
+    lo, hi = lower_arr[0], upper_arr[0]
+    m_init = anchored_slopes(x_sel, y_sel, x_thresh, y_min, lo, hi)['m'][0]
+    margin = min(1e-3 * max(abs(m_init), 1.0), (hi - lo) / 2)
+    init = np.array([np.clip(m_init, lo + margin, hi - margin)])
+
+    res = least_squares(residuals, init, args=(x_sel, y_sel), bounds=(lower_arr, upper_arr),
+                        ftol=1e-9, xtol=1e-9, gtol=1e-9, max_nfev=max_nfev)
+    return res.x[0], res
+
+
+def draw_linear_fit(x_sel, y_sel, m_fit, b_fit, x_thresh, y_min, title):
+    import matplotlib.pyplot as plt
+
+    xs = np.linspace(np.nanmin(x_sel) - 1, np.nanmax(x_sel) + 1, 400)
+    ys = m_fit * xs + b_fit
+    plt.figure(figsize=(8,6))
+    plt.scatter(x_sel, y_sel, label='data (x >= {:.1f})'.format(x_thresh), c='C0')
+    plt.plot(xs, ys, 'r-', lw=2, label=f'fit: y = {m_fit:.4g}*x + {b_fit:.4g}')
+    plt.scatter([x_thresh], [y_min], color='black', zorder=5, label=f'y({x_thresh}) enforced = {y_min:.3g}')
+    plt.xlabel(f'x (>= {x_thresh})')
+    plt.ylabel('y')
+    plt.legend()
+    plt.title('Linear fit for '+title)
+    return plt.gcf()
+
+
+def temperature_plots(df_Emergency, x_thresh=X_THRESH):
+    x_july = df_Emergency[july_col]
+    x_august = df_Emergency[august_col]
     # as numpy arrays
     x_july_np = x_july.to_numpy(dtype=float)
     x_august_np = x_august.to_numpy(dtype=float)
@@ -142,21 +328,14 @@ def temperature_plots():
     lower = [0]
     upper = [1e6]
 
-    out = fit_linear_with_intercept_enforced(x_july_np, y_list, lower, upper, title = 'July',
-                                             x_thresh=80.0, y_min=np.nanmin(y_list), plot=True)
-    print("m =", out['m'], "b =", out['b'], "RMSE =", out['rmse'], "R2 =", out['r2'])
-
-    out = fit_linear_with_intercept_enforced(x_august_np, y_list, lower, upper, title = 'August',
-                                             x_thresh=80.0, y_min=np.nanmin(y_list), plot=True)
-    print("m =", out['m'], "b =", out['b'], "RMSE =", out['rmse'], "R2 =", out['r2'])
+    # July, August and the max of both are fitted together in one pass
+    out = fit_linear_with_intercept_enforced(np.vstack([x_july_np, x_august_np, x_max_np]), y_np, lower, upper,
+                                             title=['July', 'August', 'max temp'],
+                                             x_thresh=x_thresh, y_min=np.nanmin(y_list), plot=True)
+    for i in range(3):
+        print("m =", out['m'][i], "b =", out['b'][i], "RMSE =", out['rmse'][i], "R2 =", out['r2'][i])
 
 
-    out = fit_linear_with_intercept_enforced(x_max_np, y_list, lower, upper, title = 'max temp',
-                                             x_thresh=80.0, y_min=np.nanmin(y_list), plot=True)
-    print("m =", out['m'], "b =", out['b'], "RMSE =", out['rmse'], "R2 =", out['r2'])
-
-
-temperature_plots()
 # Ok, now I have an acceptable relationship between temperature and emergency visit.
 # August has a lower
 # Now I need to normalize this
@@ -164,107 +343,139 @@ temperature_plots()
 # Time to redo EDA, but this time with residuals instead
 
 
-sns.set_style("whitegrid")
-county_df = pd.read_excel("County_Statistics_with_Temp.xlsx")
-# dropping hospitalization
-county_df = county_df.drop('Hospitalizations / 100000', axis=1)
-# drop na to drop rows with empty values for emergency visits
-# our target is emergency visits for this analysis
-
-county_df = county_df.dropna()
-county_df.head()
-# remove all instances of '%'
-county_df['Park within 1/2 Mile'] = county_df['Park within 1/2 Mile'].str.removesuffix('%')
-county_df['Imperviousness'] = county_df['Imperviousness'].str.removesuffix('%')
-county_df['Energy Burden % of Income'] = county_df['Energy Burden % of Income'].str.removesuffix('%')
-county_df['Housing Built before 1980'] = county_df['Housing Built before 1980'].str.removesuffix('%')
-county_df['Housing Insecurity'] = county_df['Housing Insecurity'].str.removesuffix('%')
-county_df['Lack of Reliable Transportation'] = county_df['Lack of Reliable Transportation'].str.removesuffix('%')
-county_df['% w/o Internet'] = county_df['% w/o Internet'].str.removesuffix('%')
-county_df['Utility Services Threat'] = county_df['Utility Services Threat'].str.removesuffix('%')
-
-# convert to float
-county_df['Park within 1/2 Mile'] = county_df['Park within 1/2 Mile'].astype(float)
-county_df['Imperviousness'] = county_df['Imperviousness'].astype(float)
-county_df['Energy Burden % of Income'] = county_df['Energy Burden % of Income'].astype(float)
-county_df['Hospital Beds / 10000'] = county_df['Hospital Beds / 10000'].astype(float)
-county_df['Housing Built before 1980'] = county_df['Housing Built before 1980'].astype(float)
-county_df['Housing Insecurity'] = county_df['Housing Insecurity'].astype(float)
-county_df['Lack of Reliable Transportation'] = county_df['Lack of Reliable Transportation'].astype(float)
-county_df['% w/o Internet'] = county_df['% w/o Internet'].astype(float)
-county_df['Utility Services Threat'] = county_df['Utility Services Threat'].astype(float)
-
-
-# copy to avoid modifying original unless intended
-county_df_residual = county_df.copy()
+# Max of the July and August temperatures and the emergency visit rate, the series of the max temp fit
+def heat_series(df_Emergency):
+    # np.fmax returns the non-NaN value when one side is NaN
+    x_max = np.fmax(df_Emergency[july_col].to_numpy(dtype=float), df_Emergency[august_col].to_numpy(dtype=float))
+    return x_max, df_Emergency[y_col].to_numpy(dtype=float)
 
-# column names
-july_col = "July max temp (F)"
-august_col = "August max temp (F)"
-y_col = "Emergency Visits / 100000"
 
-# compute elementwise max of July/August (np.fmax returns non-NaN if one side is NaN)
-county_df_residual['max_july_august_temp'] = np.fmax(county_df_residual[july_col].astype(float).to_numpy(),
-                                            county_df_residual[august_col].astype(float).to_numpy())
+# Slope and intercept of the max temp fit at x_thresh, the trend residual_frame subtracts
+def heat_parameters(df, x_thresh=X_THRESH):
+    x_max, y = heat_series(emergency_frame(df))
+    fit = anchored_slopes(x_max, y, x_thresh, np.nanmin(y), 0, 1e6)
+    return fit['m'][0], fit['b'][0]
 
-# fitted parameters (from your fit)
-m = 1.8291274417820222
-b = -143.4401953425618   # set so that y(80)=y_min in your fit
-# compute y_hat and residuals using the max temp
-temp = county_df_residual['max_july_august_temp'].astype(float)
-y_obs = county_df_residual[y_col].astype(float)
 
-# y_hat will be NaN wherever temp or y_obs is NaN (we keep NaNs)
-y_hat = m * temp + b
-y_resid = y_obs - y_hat
+# Counties at or above the x_thresh threshold with the temperature trend m * temp + b subtracted
+# from their emergency visit rate
+# m and b default to the max temp fit at x_thresh
+def residual_frame(df, m=None, b=None, x_thresh=X_THRESH):
+    if m is None or b is None:
+        m, b = heat_parameters(df, x_thresh)
+
+    county_df = df.copy()
+    # dropping hospitalization
+    county_df = county_df.drop('Hospitalizations / 100000', axis=1)
+    # drop na to drop rows with empty values for emergency visits
+    # our target is emergency visits for this analysis
+    county_df = county_df.dropna()
+    # indicator columns arrive as float64 numbers, percentages already stripped at ingest
+    # (see data/scripts/county_join.py), so no string cleanup is needed here
+
+    # copy to avoid modifying original unless intended
+    county_df_residual = county_df.copy()
+
+    # compute elementwise max of July/August (np.fmax returns non-NaN if one side is NaN)
+    county_df_residual['max_july_august_temp'] = np.fmax(county_df_residual[july_col].astype(float).to_numpy(),
+                                                county_df_residual[august_col].astype(float).to_numpy())
+
+    # compute y_hat and residuals using the max temp
+    temp = county_df_residual['max_july_august_temp'].astype(float)
+    y_obs = county_df_residual[y_col].astype(float)
+
+    # y_hat will be NaN wherever temp or y_obs is NaN (we keep NaNs)
+    y_hat = m * temp + b
+    y_resid = y_obs - y_hat
+
+    # assign new columns
+    county_df_residual[resid_col] = y_resid
+    county_df_residual = county_df_residual[county_df_residual['max_july_august_temp'] >= x_thresh]
+    return county_df_residual
 
-# assign new columns
-resid_col = y_col + " temp residual"
-county_df_residual[resid_col] = y_resid
-county_df_residual = county_df_residual[county_df_residual['max_july_august_temp'] >= 80]
 
+def draw_residual_pairplot(data, features):
+    import seaborn as sns
 
-def pairplot_residual(features, imperial=False):
+    with sns.axes_style("whitegrid"):
+        return sns.pairplot(data,
+            y_vars=["Emergency Visits / 100000 temp residual"],
+            x_vars=features,
+            height=5,
+            diag_kind=None,
+        )
+
+
+def draw_feature_pairplot(data, features):
+    import seaborn as sns
+
+    with sns.axes_style("whitegrid"):
+        return sns.pairplot(data=data,
+                            x_vars=features,
+                            y_vars=features,
+                            hue=data.columns[0],
+                            plot_kws={'alpha': .6})
+
+
+# Train/validate split of the residual counties, the validate part is held out of the regressions
+def split_residuals(county_df_residual):
+    from sklearn.model_selection import train_test_split
+
+    return train_test_split(county_df_residual, test_size=0.2, random_state=216, shuffle=True)
+
+
+# Built environment indicators of the residual table (the candidates for the regressions)
+def indicator_columns(county_df_residual):
+    return list(county_df_residual.columns[2:11])
+
+
+# The pair plot grids are the slowest figures, plotting.configure can skip or downsample them
+def pairplot_residual(county_df_residual, features, imperial=False):
     if imperial:
         residual = county_df_residual
 
     else:
         residual = county_df_residual[county_df_residual['County'] != "Imperial"]
 
-    county_train, county_test = train_test_split(
-        county_df_residual, test_size=0.2, random_state=216, shuffle=True
-    )
+    county_train, county_test = split_residuals(county_df_residual)
 
-    sns.pairplot(county_train,
-        y_vars=["Emergency Visits / 100000 temp residual"],
-        x_vars=features,
-        height=5,
-        diag_kind=None,
-    )
-
-    plt.show()
+    selection = pairplot_selection(county_train, features)
+    if selection is not None:
+        # equal-length feature lists get different files
+        name = f'{len(selection[1])} features {features_tag(selection[1])}'
+        render(draw_residual_pairplot, 'residual pairplot ' + name,
+               data=selection[0], features=selection[1])
 
     print("Correlations with Emergency Visits / 100000 residuals")
     print(county_df_residual[features].corrwith(county_df_residual['Emergency Visits / 100000 temp residual']))
     print()
 
-    sns.pairplot(data=county_train,
-                 x_vars=features,
-                 y_vars=features,
-                 hue=county_train.columns[0],
-                 plot_kws={'alpha': .6})
+    if selection is not None:
+        render(draw_feature_pairplot, 'feature pairplot ' + name,
+               data=selection[0], features=selection[1])
 
     return county_train, county_test
 
 
-pairplot_residual(county_df_residual.columns[2:11], imperial=True)
+# The full EDA: temperature fits, residuals, pair plots, and the train/validate split
+# written to train_file / validate_file for the regression step
+# x_thresh is the heat breakpoint, the residuals use the max temp fit at that threshold
+# When plotting renders to files, the queued figures are written at the end
+def run_eda(path=COUNTY_STATS_FILE, train_file=TRAIN_FILE, validate_file=VALIDATE_FILE, x_thresh=X_THRESH):
+    df = load_county_stats(path)
+    temperature_plots(emergency_frame(df), x_thresh)
+
+    m, b = heat_parameters(df, x_thresh)
+    print(f"Residuals use m = {m} b = {b} (threshold {x_thresh} F)")
+    county_df_residual = residual_frame(df, m, b, x_thresh)
+    pairplot_residual(county_df_residual, indicator_columns(county_df_residual), imperial=True)
+
+    county_train, county_test = pairplot_residual(county_df_residual, FEATURES)
 
-# We are going to use 4 features
-features = ['Energy Burden % of Income', 'Park within 1/2 Mile', 'Imperviousness', '% w/o Internet']
-county_train, county_test = pairplot_residual(features)
+    clean_county_train = county_train[['County', *FEATURES, 'Emergency Visits / 100000 temp residual']]
+    clean_county_validate = county_test[['County', *FEATURES, 'Emergency Visits / 100000 temp residual']]
 
-clean_county_train = county_train[['County', *features, 'Emergency Visits / 100000 temp residual']]
-clean_county_validate = county_test[['County', *features, 'Emergency Visits / 100000 temp residual']]
+    clean_county_train.to_csv(train_file, index=False)
+    clean_county_validate.to_csv(validate_file, index=False)
 
-clean_county_train.to_csv('src/train_post_EDA.csv', index=False)
-clean_county_validate.to_csv('src/validate_post_EDA.csv', index=False)
+    return flush()
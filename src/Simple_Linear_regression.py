@@ -1,41 +1,30 @@
-import matplotlib.pyplot as plt
-import pandas as pd
-import numpy as np
+import os
 
-from sklearn.model_selection import KFold
-from sklearn.linear_model import LinearRegression
-from sklearn.metrics import mean_squared_error, r2_score
+import numpy as np
 
+from src.artifacts import FEATURES
+from src.feature_search import cv_scores, kfold_masks
+from src.plotting import flush, render
+from src.result_cache import cached_call
 
-df = pd.read_csv("src/train_post_EDA.csv")
 
-def regressor(feature):
-    print("Using Feature:", feature)
+# Importing this module only defines the regressions, run_regressions() fits and plots them
+# (python __main__.py regress). pandas and matplotlib are imported inside the functions,
+# figures go through src/plotting.py. python __main__.py search compares every feature subset.
 
-    model = LinearRegression()
-    kfold = KFold(n_splits=5, shuffle=True, random_state=25)
+TRAIN_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "train_post_EDA.csv")
 
-    X = df[[feature]]
-    y = df['Emergency Visits / 100000 temp residual']
+# The four features picked in the EDA are FEATURES (src/artifacts.py)
 
-    rmse_scores, r2_scores = [], []
-    for train_idx, test_idx in kfold.split(X):
-        X_train, X_test = X.iloc[train_idx], X.iloc[test_idx]
-        y_train, y_test = y.iloc[train_idx], y.iloc[test_idx]
 
-        model = LinearRegression().fit(X_train, y_train)
-        y_pred = model.predict(X_test)
+def load_training(path=TRAIN_FILE):
+    import pandas as pd
 
-        rmse_scores.append(np.sqrt(mean_squared_error(y_test, y_pred)))
-        r2_scores.append(r2_score(y_test, y_pred))
+    return pd.read_csv(path)
 
-    print("RMSE per fold:", rmse_scores)
-    print("Mean RMSE:", np.mean(rmse_scores))
-    print("R² per fold:", r2_scores)
-    print("Mean R²:", np.mean(r2_scores))
 
-    model.fit(X, y)
-    y_pred = model.predict(X)
+def draw_regression(X, y, y_pred, feature):
+    import matplotlib.pyplot as plt
 
     plt.figure(figsize=(8, 5))
     plt.scatter(X, y, color='blue', label='Data Points')
@@ -46,13 +35,41 @@ def regressor(feature):
     plt.title(f"Linear Regression: {feature} vs Emergency Visits")
     plt.legend()
     plt.grid(True)
-    plt.show()
+    return plt.gcf()
+
+
+# Cross-validated scores come from src/feature_search.py, the same folds as KFold(5, shuffle=True, random_state=25),
+# and are reused from src/result_cache.py while the training data is unchanged
+def regressor(df, feature):
+    print("Using Feature:", feature)
 
-    print("Regression Equation: y = {:.3f}x + {:.3f}".format(model.coef_[0], model.intercept_))
+    X = df[[feature]]
+    y = df['Emergency Visits / 100000 temp residual']
+
+    rmse_scores, r2_scores = cached_call(cv_scores, X.to_numpy(dtype=float), y.to_numpy(dtype=float), [(0,)],
+                                         kfold_masks(len(y), n_splits=5, seed=25))
+    rmse_scores, r2_scores = rmse_scores[0].tolist(), r2_scores[0].tolist()
+
+    print("RMSE per fold:", rmse_scores)
+    print("Mean RMSE:", np.mean(rmse_scores))
+    print("R² per fold:", r2_scores)
+    print("Mean R²:", np.mean(r2_scores))
+
+    # fit on all of the training data
+    design = np.column_stack([np.ones(len(X)), X.to_numpy(dtype=float)])
+    intercept, coef = np.linalg.lstsq(design, y.to_numpy(dtype=float), rcond=None)[0]
+    y_pred = design @ [intercept, coef]
+
+    render(draw_regression, f"regression {feature}", X=X, y=y, y_pred=y_pred, feature=feature)
+
+    print("Regression Equation: y = {:.3f}x + {:.3f}".format(coef, intercept))
     print()
 
 
-regressor("Energy Burden % of Income")
-regressor("Park within 1/2 Mile")
-regressor("Imperviousness")
-regressor("% w/o Internet")
+# When plotting renders to files, the queued figures are written at the end
+def run_regressions(path=TRAIN_FILE, features=FEATURES):
+    df = load_training(path)
+    for feature in features:
+        regressor(df, feature)
+
+    return flush()
@@ -0,0 +1,30 @@
+import os
+
+
+# Tables the build writes (data/scripts/cleanup_with_temperature.py) and the analysis reads
+# Both sides import these paths, so whatever `python __main__.py build` last wrote is what eda,
+# regress, sweep, search and score see.
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DATA_DIR = os.path.join(REPO_DIR, "data")
+
+COUNTY_STATS_FILE = os.path.join(DATA_DIR, "County_Statistics_withTemp.parquet")
+COUNTY_STATS_REPORT = os.path.join(DATA_DIR, "County_Statistics_withTemp.xlsx")
+
+# The four county table columns picked in the EDA, the features of the regressions, the residual
+# model and the train / validate CSVs
+FEATURES = ["Energy Burden % of Income", "Park within 1/2 Mile", "Imperviousness", "% w/o Internet"]
+
+# California tracts of the Master CVI workbook with their food access (data/scripts/cvi_stream.py)
+CVI_TRACTS_FILE = os.path.join(DATA_DIR, "California_CVI_dataset.parquet")
+CVI_TRACTS_REPORT = os.path.join(DATA_DIR, "California_CVI_dataset.xlsx")
+
+# Tract level CVI and food access aggregated per county (data/scripts/tract_aggregate.py), search --cvi
+CVI_COUNTY_FILE = os.path.join(DATA_DIR, "County_CVI_features.parquet")
+
+# County table committed with the analysis, read until the build has written COUNTY_STATS_FILE
+# (the NOAA history files the temperature stage needs are not part of the repository)
+COUNTY_STATS_SNAPSHOT = os.path.join(REPO_DIR, "County_Statistics_with_Temp.xlsx")
+# Likewise the tract table, the cvi_counties stage reads it until the cvi stage has written CVI_TRACTS_FILE
+# (the Master CVI workbook is not part of the repository either)
+CVI_TRACTS_SNAPSHOT = os.path.join(REPO_DIR, "California_CVI_dataset.xlsx")
@@ -0,0 +1,151 @@
+import itertools
+
+import numpy as np
+
+from src.result_cache import cached_call
+
+
+# Cross-validated linear regressions of the temperature residual on every feature subset
+# A least squares fit with an intercept only needs the Gram matrix Z'Z and Z'y of its design
+# Z = [1, X]. They are computed once per fold for the test rows and once for all rows, the training
+# statistics of a fold are the difference. The fit of a subset S on a fold is then the solution of
+# the small system G_train[S, S] beta = c_train[S], and its test error follows from G_test, c_test
+# and y'y of the test rows, without touching the data again. All subsets of one size and all folds
+# are solved together as one stack of systems.
+
+TARGET = "Emergency Visits / 100000 temp residual"
+# Subsets solved per batch, bounds the memory of the stacked systems
+BATCH = 4096
+
+
+# (folds, n) test masks of n_repeats shuffled KFold splits
+# Repeat r uses KFold(n_splits, shuffle=True, random_state=seed + r), so the first repeat has
+# the same folds as regressor in src/Simple_Linear_regression.py
+def kfold_masks(n, n_splits=5, n_repeats=1, seed=25):
+    from sklearn.model_selection import KFold
+
+    masks = []
+    for r in range(n_repeats):
+        for _, test_idx in KFold(n_splits=n_splits, shuffle=True, random_state=seed + r).split(np.empty((n, 1))):
+            mask = np.zeros(n, dtype=bool)
+            mask[test_idx] = True
+            masks.append(mask)
+    return np.array(masks)
+
+
+# Sufficient statistics of every fold, column 0 of the design is the intercept
+def fold_statistics(X, y, test_masks):
+    Z = np.column_stack([np.ones(len(X)), np.asarray(X, dtype=float)])
+    y = np.asarray(y, dtype=float)
+    T = test_masks.astype(float)
+
+    # (folds, p + 1, p + 1) and (folds, p + 1) for the test rows of each fold
+    G_test = np.einsum('fi,ij,ik->fjk', T, Z, Z)
+    c_test = T @ (Z * y[:, None])
+    return {
+        'G_train': Z.T @ Z - G_test,
+        'c_train': Z.T @ y - c_test,
+        'G_test': G_test,
+        'c_test': c_test,
+        'yy_test': T @ (y * y),
+        'n_test': T.sum(axis=1),
+    }
+
+
+def _solve(G, c):
+    try:
+        return np.linalg.solve(G, c[..., None])[..., 0]
+    except np.linalg.LinAlgError:
+        # a constant or collinear subset, the pseudo inverse gives the minimum norm fit
+        return (np.linalg.pinv(G) @ c[..., None])[..., 0]
+
+
+# Test RMSE and R2 per fold, (subsets, folds) arrays, for subsets of equal size given as an
+# (m, s) array of column indices into X
+def subset_scores(stats, subsets):
+    idx = np.column_stack([np.zeros(len(subsets), dtype=int), np.asarray(subsets) + 1])
+    rows, cols = idx[:, :, None], idx[:, None, :]
+
+    # (folds, m, s + 1, s + 1) systems and right-hand sides
+    beta = _solve(stats['G_train'][:, rows, cols], stats['c_train'][:, idx])
+    G_test = stats['G_test'][:, rows, cols]
+    c_test = stats['c_test'][:, idx]
+
+    n = stats['n_test'][:, None]
+    sse = (stats['yy_test'][:, None] - 2 * np.einsum('fmi,fmi->fm', beta, c_test)
+           + np.einsum('fmi,fmij,fmj->fm', beta, G_test, beta))
+    # c_test[..., 0] is the sum of y over the test rows
+    sst = stats['yy_test'][:, None] - stats['c_test'][:, None, 0] ** 2 / n
+    sse = np.maximum(sse, 0)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        r2 = np.where(sst > 0, 1 - sse / sst, np.nan)
+    return np.sqrt(sse / n).T, r2.T
+
+
+# RMSE and R2 per fold of each subset in subsets (tuples of column indices, any sizes)
+def cv_scores(X, y, subsets, test_masks):
+    stats = fold_statistics(X, y, test_masks)
+    rmse = np.empty((len(subsets), len(test_masks)))
+    r2 = np.empty_like(rmse)
+
+    by_size = {}
+    for i, subset in enumerate(subsets):
+        by_size.setdefault(len(subset), []).append(i)
+    for positions in by_size.values():
+        for start in range(0, len(positions), BATCH):
+            batch = positions[start:start + BATCH]
+            rmse[batch], r2[batch] = subset_scores(stats, [subsets[i] for i in batch])
+
+    return rmse, r2
+
+
+def feature_subsets(n_features, max_size):
+    return [subset for size in range(1, max_size + 1)
+            for subset in itertools.combinations(range(n_features), size)]
+
+
+# Every subset of up to max_size of the features, scored by n_repeats times repeated n_splits-fold CV
+# Returns one row per subset with the mean and standard deviation over all folds, best first
+# Rows with a missing feature or target are dropped
+def feature_search(df, features, target=TARGET, max_size=2, n_splits=5, n_repeats=10, seed=25, rank_by="rmse"):
+    import pandas as pd
+
+    features = list(features)
+    data = df[features + [target]].dropna()
+    X = data[features].to_numpy(dtype=float)
+    y = data[target].to_numpy(dtype=float)
+
+    subsets = feature_subsets(len(features), min(max_size, len(features)))
+    rmse, r2 = cached_call(cv_scores, X, y, subsets, kfold_masks(len(y), n_splits, n_repeats, seed))
+
+    table = pd.DataFrame({
+        "features": [" + ".join(features[j] for j in subset) for subset in subsets],
+        "size": [len(subset) for subset in subsets],
+        "rmse": np.nanmean(rmse, axis=1),
+        "rmse_std": np.nanstd(rmse, axis=1),
+        "r2": np.nanmean(r2, axis=1),
+        "r2_std": np.nanstd(r2, axis=1),
+    })
+    return table.sort_values(rank_by, ascending=rank_by == "rmse", ignore_index=True)
+
+
+# The search on the training split of the residual table, with every built environment indicator
+# cvi=True adds the county aggregates of the tract level CVI and food access columns as candidates
+def run_search(max_size=2, n_splits=5, n_repeats=10, seed=25, rank_by="rmse", out=None, cvi=False):
+    from src.EDA_County_Stats_with_temp import (
+        indicator_columns, load_county_stats, load_cvi_features, residual_frame, split_residuals,
+    )
+
+    county_df_residual = residual_frame(load_county_stats())
+    county_train, _ = split_residuals(county_df_residual)
+    features = indicator_columns(county_df_residual)
+    if cvi:
+        cvi_features = load_cvi_features()
+        county_train = county_train.merge(cvi_features, how="left", on="County")
+        features += [col for col in cvi_features.columns if col not in ("County", "Tracts")]
+
+    table = feature_search(county_train, features, TARGET, max_size, n_splits, n_repeats, seed, rank_by)
+
+    if out is not None:
+        table.to_csv(out, index=False)
+    return table
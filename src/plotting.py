@@ -0,0 +1,130 @@
+import os
+import re
+
+
+# Where figures go
+# By default every figure is drawn and shown right away with plt.show(), as in a notebook.
+# After configure(output_dir=...) figures are queued instead, and flush() renders the queue to
+# PNG files with the Agg backend, in parallel worker processes when workers > 1, so a full report
+# can be produced unattended.
+# A figure is described by a module-level draw function plus its keyword arguments, so it can be
+# sent to a worker process. The draw function builds the figure and returns it (or a seaborn grid).
+
+_settings = {
+    "output_dir": None,
+    "workers": 1,
+    "dpi": 100,
+    # "full" draws pair plots as requested, "skip" leaves them out
+    "pairplot": "full",
+    # Downsampling of pair plot grids, None keeps everything
+    "max_pairplot_features": None,
+    "max_pairplot_rows": None,
+}
+_queue = []
+
+
+def configure(output_dir=None, workers=1, dpi=100, pairplot="full", max_pairplot_features=None,
+              max_pairplot_rows=None):
+    if pairplot not in ("full", "skip"):
+        raise ValueError(f"pairplot must be 'full' or 'skip', not {pairplot!r}")
+
+    if output_dir is not None:
+        import matplotlib
+        matplotlib.use("Agg")
+        os.makedirs(output_dir, exist_ok=True)
+
+    _settings.update(output_dir=output_dir, workers=workers, dpi=dpi, pairplot=pairplot,
+                     max_pairplot_features=max_pairplot_features, max_pairplot_rows=max_pairplot_rows)
+
+
+def headless():
+    return _settings["output_dir"] is not None
+
+
+def _figure_of(drawn):
+    import matplotlib.pyplot as plt
+
+    if drawn is None:
+        return plt.gcf()
+    # seaborn grids wrap the matplotlib figure
+    return getattr(drawn, "figure", drawn)
+
+
+def _file_name(name):
+    return re.sub(r"[^A-Za-z0-9._-]+", "_", name).strip("_") + ".png"
+
+
+# Path of a new figure in the output directory, numbered _2, _3, ... when a queued figure
+# already has the name (two jobs writing one file would overwrite each other, in parallel they race)
+def _queue_path(name):
+    stem = os.path.join(_settings["output_dir"], _file_name(name))[:-len(".png")]
+    queued = {path for _, path, _ in _queue}
+    path, n = stem + ".png", 2
+    while path in queued:
+        path, n = f"{stem}_{n}.png", n + 1
+    return path
+
+
+# Show the figure now, or queue it for flush() when rendering to files
+def render(draw, name, **kwargs):
+    if not headless():
+        import matplotlib.pyplot as plt
+
+        draw(**kwargs)
+        plt.show()
+        return
+
+    _queue.append((draw, _queue_path(name), kwargs))
+
+
+def _render_to_file(draw, path, kwargs, dpi):
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+
+    fig = _figure_of(draw(**kwargs))
+    fig.savefig(path, dpi=dpi, bbox_inches="tight")
+    plt.close(fig)
+    return path
+
+
+# Render every queued figure to its file, returns the paths of the files written
+def flush():
+    jobs, _queue[:] = list(_queue), []
+    if not jobs:
+        return []
+
+    dpi = _settings["dpi"]
+    workers = min(_settings["workers"] or 1, len(jobs))
+    if workers <= 1:
+        written = [_render_to_file(draw, path, kwargs, dpi) for draw, path, kwargs in jobs]
+    else:
+        from concurrent.futures import ProcessPoolExecutor
+
+        with ProcessPoolExecutor(workers) as pool:
+            futures = [pool.submit(_render_to_file, draw, path, kwargs, dpi) for draw, path, kwargs in jobs]
+            written = [future.result() for future in futures]
+    return [path for path in dict.fromkeys(written) if os.path.exists(path)]
+
+
+# Short stable tag of a feature list, for figure names that tell equal-length selections apart
+def features_tag(features):
+    import hashlib
+
+    return hashlib.sha256("\n".join(features).encode()).hexdigest()[:8]
+
+
+# Applies the pair plot settings to a (data, features) pair
+# Returns None when pair plots are skipped, otherwise the possibly downsampled data and features
+def pairplot_selection(data, features):
+    if _settings["pairplot"] == "skip":
+        return None
+
+    features = list(features)
+    if _settings["max_pairplot_features"] is not None:
+        features = features[:_settings["max_pairplot_features"]]
+    rows = _settings["max_pairplot_rows"]
+    if rows is not None and len(data) > rows:
+        data = data.sample(rows, random_state=0)
+
+    return data, features
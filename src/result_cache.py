@@ -0,0 +1,151 @@
+import hashlib
+import os
+import pickle
+import tempfile
+
+import numpy as np
+
+
+# Disk cache of fit and cross-validation results
+# cached_call(fn, *args) returns the stored result of an earlier call with equal arguments, or calls
+# fn and stores what it returns. The key is a hash of the argument values (array contents, dtypes and
+# shapes, parameters such as thresholds, bounds and fold masks), of fn's name and of the source of the
+# module defining fn, so editing the analysis code invalidates its results.
+# Entries are pickle files. A hit refreshes the entry's mtime, and after every store the entries
+# used least recently are removed until the cache is under its size limit. An entry that fails to
+# load for any reason is deleted and counts as a miss.
+
+CACHE_VERSION = 1
+CACHE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), ".result_cache")
+
+_settings = {
+    "cache_dir": CACHE_DIR,
+    "max_bytes": 64 << 20,
+    "enabled": True,
+}
+_module_hashes = {}
+
+
+def configure(cache_dir=CACHE_DIR, max_bytes=64 << 20, enabled=True):
+    _settings.update(cache_dir=cache_dir, max_bytes=max_bytes, enabled=enabled)
+
+
+def _module_hash(fn):
+    import inspect
+
+    try:
+        path = inspect.getsourcefile(fn)
+    except TypeError:
+        # builtins and C extensions, their name is all there is
+        return ""
+    if path is None:
+        return ""
+    if path not in _module_hashes:
+        with open(path, "rb") as f:
+            _module_hashes[path] = hashlib.sha256(f.read()).hexdigest()
+    return _module_hashes[path]
+
+
+# Feed a value into the hash, recursing into containers
+def _update(h, value):
+    if isinstance(value, np.ndarray):
+        value = np.ascontiguousarray(value)
+        h.update(f"ndarray|{value.dtype.str}|{value.shape}|".encode())
+        h.update(value.tobytes())
+    elif hasattr(value, "to_numpy") and hasattr(value, "columns"):
+        # DataFrame, column names and contents
+        h.update(f"DataFrame|{list(value.columns)}|".encode())
+        for col in value.columns:
+            _update(h, value[col].to_numpy())
+    elif hasattr(value, "to_numpy"):
+        h.update(f"Series|{value.name}|".encode())
+        _update(h, value.to_numpy())
+    elif isinstance(value, (list, tuple)):
+        h.update(f"{type(value).__name__}|{len(value)}|".encode())
+        for item in value:
+            _update(h, item)
+    elif isinstance(value, dict):
+        h.update(f"dict|{len(value)}|".encode())
+        for key in sorted(value, key=repr):
+            _update(h, key)
+            _update(h, value[key])
+    elif callable(value):
+        h.update(f"callable|{value.__module__}.{value.__qualname__}|{_module_hash(value)}|".encode())
+    else:
+        h.update(f"{type(value).__name__}|{value!r}|".encode())
+
+
+def cache_key(fn, args, kwargs):
+    h = hashlib.sha256(f"v{CACHE_VERSION}|".encode())
+    _update(h, fn)
+    _update(h, args)
+    _update(h, kwargs)
+    return h.hexdigest()
+
+
+def _evict(cache_dir, max_bytes):
+    entries = []
+    for name in os.listdir(cache_dir):
+        if name.endswith(".pkl"):
+            st = os.stat(os.path.join(cache_dir, name))
+            entries.append((st.st_mtime_ns, st.st_size, name))
+
+    total = sum(size for _, size, _ in entries)
+    for _, size, name in sorted(entries):
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(os.path.join(cache_dir, name))
+        except FileNotFoundError:
+            pass
+        total -= size
+
+
+def cached_call(fn, *args, **kwargs):
+    if not _settings["enabled"]:
+        return fn(*args, **kwargs)
+
+    cache_dir = _settings["cache_dir"]
+    path = os.path.join(cache_dir, cache_key(fn, args, kwargs) + ".pkl")
+    try:
+        with open(path, "rb") as f:
+            result = pickle.load(f)
+    except FileNotFoundError:
+        pass
+    except Exception:
+        # truncated or corrupt, or its classes moved since it was written: drop it and recompute
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+    else:
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return result
+
+    result = fn(*args, **kwargs)
+
+    # Write to a scratch file first so a crashed run never leaves a half-written entry
+    os.makedirs(cache_dir, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=cache_dir, prefix=".tmp-")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            pickle.dump(result, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, path)
+    except OSError:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        return result
+
+    _evict(cache_dir, _settings["max_bytes"])
+    return result
+
+
+def clear():
+    cache_dir = _settings["cache_dir"]
+    if os.path.isdir(cache_dir):
+        for name in os.listdir(cache_dir):
+            if name.endswith(".pkl"):
+                os.remove(os.path.join(cache_dir, name))
@@ -0,0 +1,203 @@
+import itertools
+from typing import NamedTuple
+
+import numpy as np
+
+from src.EDA_County_Stats_with_temp import (
+    FEATURES, X_THRESH, august_col, heat_parameters, july_col, resid_col, residual_frame, split_residuals,
+)
+
+
+# Batch scoring of the residual model for what-if scenarios
+# The model is the heat curve of the EDA, m * temp + b above the x_thresh breakpoint (flat below it:
+# no unusual risk), plus a linear regression of the temperature residuals on the features.
+# A scenario changes the county temperatures (temp_delta, in F) and the features: each feature is
+# multiplied by its scale and then shifted by its delta, so scale 1.1 is +10% park access and
+# delta -5 is 5 points less imperviousness. Any of these can be one value per scenario or one
+# per scenario and county.
+# Scores of all scenarios x counties are computed in one broadcast per chunk of scenarios, so
+# the grid is never held as a (scenarios, counties, features) array larger than CHUNK_BYTES.
+# Per-scenario scale and delta (the same for every county) skip that array altogether: the model is
+# linear, so (X * scale + delta) @ coef is X @ (scale * coef) + delta @ coef, one matrix product.
+
+CHUNK_BYTES = 32 << 20
+# The four features are percentages, bounds=FEATURE_BOUNDS keeps scenarios inside 0-100
+FEATURE_BOUNDS = (0.0, 100.0)
+
+
+class ResidualModel(NamedTuple):
+    # heat curve m * max(temp, x_thresh) + b
+    m: float
+    b: float
+    x_thresh: float
+    # regression of the residuals, intercept + features @ coef
+    features: tuple
+    intercept: float
+    coef: np.ndarray
+
+
+# Fit the heat curve at x_thresh on the county table, then the residual regression on all features
+# together, on the training split of the EDA (the validate counties stay held out)
+def fit_residual_model(df, features=FEATURES, x_thresh=X_THRESH):
+    m, b = heat_parameters(df, x_thresh)
+    train, _ = split_residuals(residual_frame(df, m, b, x_thresh))
+
+    features = list(features)
+    design = np.column_stack([np.ones(len(train)), train[features].to_numpy(dtype=float)])
+    beta = np.linalg.lstsq(design, train[resid_col].to_numpy(dtype=float), rcond=None)[0]
+    return ResidualModel(m=float(m), b=float(b), x_thresh=float(x_thresh), features=tuple(features),
+                         intercept=float(beta[0]), coef=beta[1:])
+
+
+# Max July / August temperature and the (counties, features) matrix of a county table
+# NaN anywhere in a county's inputs gives NaN scores for it
+def county_inputs(df, features):
+    temps = np.fmax(df[july_col].to_numpy(dtype=float), df[august_col].to_numpy(dtype=float))
+    return temps, df[list(features)].to_numpy(dtype=float)
+
+
+# Predicted emergency visit rate for temperatures and feature values, broadcast together
+def predict(model, temps, X):
+    heat = model.m * np.maximum(temps, model.x_thresh) + model.b
+    return heat + model.intercept + np.asarray(X, dtype=float) @ model.coef
+
+
+# (scenarios, 1) or (scenarios, counties) temperature changes
+def _temp_changes(temp_delta):
+    td = np.asarray(temp_delta, dtype=float)
+    return td.reshape(-1, 1) if td.ndim < 2 else td
+
+
+# (scenarios, 1, features) or (scenarios, counties, features) scales / deltas, None stays None
+def _feature_changes(values, p):
+    if values is None:
+        return None
+    v = np.asarray(values, dtype=float)
+    if v.ndim == 1:
+        v = v.reshape(1, p)
+    return v[:, None, :] if v.ndim == 2 else v
+
+
+def _rows(a, lo, hi):
+    return a if a.shape[0] == 1 else a[lo:hi]
+
+
+# The changes in broadcastable shapes, and the number of scenarios
+def _changes(temp_delta, scale, delta, p):
+    td = _temp_changes(temp_delta)
+    sc = _feature_changes(scale, p)
+    dl = _feature_changes(delta, p)
+    return td, sc, dl, max(a.shape[0] for a in (td, sc, dl) if a is not None)
+
+
+# Yields (first scenario, (n, counties) block of scores) for consecutive chunks of scenarios
+# temps (counties,) and X (counties, features) are the baseline. temp_delta is (scenarios,) or
+# (scenarios, counties), scale and delta (scenarios, features) or (scenarios, counties, features).
+# bounds (lo, hi) clips the changed features. chunk_size is scenarios per block, by default as many
+# as fit in CHUNK_BYTES.
+def iter_scores(model, temps, X, temp_delta=0.0, scale=None, delta=None, bounds=None, chunk_size=None):
+    temps = np.asarray(temps, dtype=float)
+    X = np.asarray(X, dtype=float)
+    n_counties, p = X.shape
+    td, sc, dl, n_scenarios = _changes(temp_delta, scale, delta, p)
+    # the matrix product shortcut needs changes shared by all counties and no clipping
+    per_county = bounds is not None or any(a is not None and a.shape[1] > 1 for a in (sc, dl))
+    if chunk_size is None:
+        row_bytes = n_counties * 8 * (p + 2 if per_county else 3)
+        chunk_size = max(1, CHUNK_BYTES // row_bytes)
+
+    base = X @ model.coef
+    for lo in range(0, n_scenarios, chunk_size):
+        hi = min(lo + chunk_size, n_scenarios)
+        heat = model.m * np.maximum(temps + _rows(td, lo, hi), model.x_thresh) + model.b
+
+        if per_county:
+            Xs = X if sc is None else X * _rows(sc, lo, hi)
+            Xs = Xs if dl is None else Xs + _rows(dl, lo, hi)
+            if bounds is not None:
+                Xs = np.clip(Xs, *bounds)
+            features = np.broadcast_to(Xs @ model.coef, (hi - lo, n_counties))
+        else:
+            features = base if sc is None else (_rows(sc, lo, hi)[:, 0] * model.coef) @ X.T
+            if dl is not None:
+                features = features + (_rows(dl, lo, hi)[:, 0] @ model.coef)[:, None]
+        yield lo, np.broadcast_to(heat + model.intercept + features, (hi - lo, n_counties))
+
+
+# (scenarios, counties) scores, written into out when given (e.g. a memory-mapped .npy for grids
+# larger than memory), see iter_scores for the arguments
+def score(model, temps, X, temp_delta=0.0, scale=None, delta=None, bounds=None, chunk_size=None, out=None):
+    if out is None:
+        X = np.asarray(X, dtype=float)
+        out = np.empty((_changes(temp_delta, scale, delta, X.shape[1])[3], len(X)))
+    for lo, block in iter_scores(model, temps, X, temp_delta, scale, delta, bounds, chunk_size):
+        out[lo:lo + len(block)] = block
+    return out
+
+
+# Every combination of the given changes, one row per scenario
+# temp_delta is a list of temperature changes, scale and delta map features to lists of values
+# Features without a value keep scale 1 and delta 0.
+def scenario_grid(features, temp_delta=(0.0,), scale=None, delta=None):
+    import pandas as pd
+
+    axes = {"temp_delta": list(temp_delta)}
+    for kind, changes in (("scale", scale or {}), ("delta", delta or {})):
+        for feature, values in changes.items():
+            if feature not in features:
+                raise ValueError(f"{feature!r} is not a model feature, expected one of {list(features)}")
+            axes[f"{feature} {kind}"] = list(values)
+    grid = pd.DataFrame(list(itertools.product(*axes.values())), columns=list(axes))
+    for feature in features:
+        grid[f"{feature} scale"] = grid.get(f"{feature} scale", 1.0)
+        grid[f"{feature} delta"] = grid.get(f"{feature} delta", 0.0)
+    return grid
+
+
+# temp_delta, scale and delta arrays of a scenario_grid table
+def scenario_arrays(model, scenarios):
+    scale = scenarios[[f"{feature} scale" for feature in model.features]].to_numpy(dtype=float)
+    delta = scenarios[[f"{feature} delta" for feature in model.features]].to_numpy(dtype=float)
+    return scenarios["temp_delta"].to_numpy(dtype=float), scale, delta
+
+
+# Scores of every scenario row of a scenario_grid table for every county of df (counties in columns)
+def score_scenarios(model, df, scenarios, bounds=None, chunk_size=None, out=None):
+    temps, X = county_inputs(df, model.features)
+    return score(model, temps, X, *scenario_arrays(model, scenarios), bounds, chunk_size, out)
+
+
+# Fit the model on the county table, score the grid and summarize each scenario over the counties
+# out=path also writes the full (scenarios, counties) matrix as a memory-mapped .npy file
+def run_scoring(temp_delta=(0.0,), scale=None, delta=None, x_thresh=X_THRESH, clip=False, out=None):
+    from src.EDA_County_Stats_with_temp import load_county_stats
+
+    df = load_county_stats()
+    model = fit_residual_model(df, x_thresh=x_thresh)
+    scenarios = scenario_grid(model.features, temp_delta, scale, delta)
+
+    n = len(scenarios)
+    target = None
+    if out is not None:
+        target = np.lib.format.open_memmap(out, mode="w+", dtype=np.float64, shape=(n, len(df)))
+    temps, X = county_inputs(df, model.features)
+
+    summary = {key: np.empty(n) for key in ("mean", "min", "max")}
+    # counties with missing inputs are NaN, left out of the summaries
+    with np.errstate(all="ignore"):
+        for lo, block in iter_scores(model, temps, X, *scenario_arrays(model, scenarios),
+                                     bounds=FEATURE_BOUNDS if clip else None):
+            hi = lo + len(block)
+            if target is not None:
+                target[lo:hi] = block
+            summary["mean"][lo:hi] = np.nanmean(block, axis=1)
+            summary["min"][lo:hi] = np.nanmin(block, axis=1)
+            summary["max"][lo:hi] = np.nanmax(block, axis=1)
+    if target is not None:
+        target.flush()
+
+    changed = [col for col in scenarios.columns if scenarios[col].nunique() > 1] or ["temp_delta"]
+    table = scenarios[changed].copy()
+    for key, values in summary.items():
+        table[f"{key} rate"] = values
+    return model, table
@@ -0,0 +1,92 @@
+import numpy as np
+
+from src.EDA_County_Stats_with_temp import X_THRESH, anchored_slopes, emergency_frame, heat_series
+
+
+# Sensitivity of the max temp fit to the heat breakpoint
+# Every threshold on a grid is refitted on the full data and on bootstrap resamples of the counties.
+# All refits are rows of one anchored_slopes stack, solved in closed form. The resamples are split
+# into chunks, which run in worker processes when workers > 1. The resample indices are drawn up
+# front from one seed, so the results do not depend on the number of workers or the chunk size.
+# Usage: python __main__.py sweep [--boot N] [--workers N] [--out FILE]
+
+THRESHOLDS = np.arange(70.0, 90.5, 0.5)
+LOWER, UPPER = 0, 1e6
+STATS = ['m', 'b', 'rmse', 'r2']
+
+
+# Fits of every threshold on every resample, {stat: (thresholds, resamples) array}
+# The anchor y_min is the min of each resample, as the full fit anchors at the min of the full data
+def _fit_resamples(x, y, thresholds, idx):
+    x_boot, y_boot = x[idx], y[idx]
+    t, r = len(thresholds), len(idx)
+    fit = anchored_slopes(np.tile(x_boot, (t, 1)), np.tile(y_boot, (t, 1)), np.repeat(thresholds, r),
+                          np.tile(np.nanmin(y_boot, axis=1), t), LOWER, UPPER)
+    return {stat: fit[stat].reshape(t, r) for stat in STATS}
+
+
+def bootstrap_fits(x, y, thresholds=THRESHOLDS, n_boot=1000, seed=0, workers=1, chunk_size=250):
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    thresholds = np.asarray(thresholds, dtype=float)
+    idx = np.random.default_rng(seed).integers(0, len(x), size=(n_boot, len(x)))
+    chunks = [idx[i:i + chunk_size] for i in range(0, n_boot, chunk_size)]
+
+    if workers <= 1 or len(chunks) <= 1:
+        parts = [_fit_resamples(x, y, thresholds, chunk) for chunk in chunks]
+    else:
+        from concurrent.futures import ProcessPoolExecutor
+
+        with ProcessPoolExecutor(min(workers, len(chunks))) as pool:
+            parts = list(pool.map(_fit_resamples, *zip(*[(x, y, thresholds, chunk) for chunk in chunks])))
+
+    return {stat: np.concatenate([part[stat] for part in parts], axis=1) for stat in STATS}
+
+
+# Slope, intercept, RMSE and R2 per threshold with percentile bootstrap intervals at level
+# One row per threshold, the columns are threshold, n (counties at or above it), m, b, rmse, r2
+# and <stat>_lo / <stat>_hi for each of them
+def threshold_sweep(x, y, thresholds=THRESHOLDS, n_boot=1000, level=0.95, seed=0, workers=1, chunk_size=250):
+    import pandas as pd
+
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    thresholds = np.asarray(thresholds, dtype=float)
+
+    k = len(thresholds)
+    full = anchored_slopes(np.tile(x, (k, 1)), y, thresholds, np.nanmin(y), LOWER, UPPER)
+    surface = pd.DataFrame({'threshold': thresholds, 'n': full['n']})
+    for stat in STATS:
+        surface[stat] = full[stat]
+
+    if n_boot:
+        draws = bootstrap_fits(x, y, thresholds, n_boot, seed, workers, chunk_size)
+        tail = (1 - level) / 2 * 100
+        for stat in STATS:
+            # resamples without counties above a threshold have no fit there
+            with np.errstate(all='ignore'):
+                lo, hi = np.nanpercentile(draws[stat], [tail, 100 - tail], axis=1)
+            surface[stat + '_lo'] = lo
+            surface[stat + '_hi'] = hi
+
+    return surface
+
+
+# The row of the surface to use for the residuals
+# by=None takes the threshold closest to x_thresh, by='r2' (or any column) the threshold maximizing it
+def choose_threshold(surface, x_thresh=X_THRESH, by=None):
+    if by is None:
+        row = surface.iloc[int(np.argmin(np.abs(surface['threshold'].to_numpy() - x_thresh)))]
+    else:
+        row = surface.loc[surface[by].idxmax()]
+    return float(row['threshold']), float(row['m']), float(row['b'])
+
+
+# The sweep on the county table
+def run_sweep(df, thresholds=THRESHOLDS, n_boot=1000, level=0.95, seed=0, workers=1, out=None):
+    x_max, y = heat_series(emergency_frame(df))
+    surface = threshold_sweep(x_max, y, thresholds, n_boot, level, seed, workers)
+
+    if out is not None:
+        surface.to_csv(out, index=False)
+    return surface